@@ -5,36 +5,79 @@
 #   S3_FILENAME="example/lasttimestamp"
 #
 # Reminder: If the bucket doesn't exists is going to be created
+#
+# Lambda reuses the container between invocations, so the S3 client (and its
+# connection pool) lives at module scope and a bucket is only checked again
+# after BUCKET_CHECK_TTL seconds (env var, 300 by default).
+#
+# Events with Records (SQS, Kinesis, DynamoDB streams) are handled as a
+# batch: every record asks for the timestamp to be written into its
+# "filename" (a json body/data field, S3_FILENAME if missing), and each file
+# gets one write for the whole batch. Failed records are returned as
+# batchItemFailures, so only those are delivered again.
 
+import base64
 from datetime import datetime
+import json
 import logging
 import os
 import sys
+import time
 
 import boto3
 
 
 logger = logging.getLogger('TimestampWritter')
 
+BUCKET_CHECK_TTL = int(os.environ.get('BUCKET_CHECK_TTL', 300))
+
+# Container scope cache, see the header
+_s3_client = None
+_bucket_checked_at = {}
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client('s3')
+    return _s3_client
+
 
 class S3BucketHandler:
 
     def __init__(self, bucket):
-        self.client = boto3.client('s3')
+        self.client = get_s3_client()
         self.bucket = bucket
-        if not any(
-            item['Name'] == bucket
-            for item in self.client.list_buckets().get('Buckets', [])
-        ):
+        if time.time() - _bucket_checked_at.get(bucket, 0) > BUCKET_CHECK_TTL:
+            self._check_bucket()
+
+    def _check_bucket(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in (
+                    '404', 'NoSuchBucket'):
+                raise
             logger.debug('Creating bucket s3://{0}'.format(self.bucket))
             self.client.create_bucket(
                 ACL='private',
-                Bucket=bucket
+                Bucket=self.bucket
             )
+        _bucket_checked_at[self.bucket] = time.time()
 
     def put(self, filename, content):
         logger.debug('writting file {0} into {1}'.format(filename, self.bucket))
 
+        try:
+            self._put_object(filename, content)
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchBucket':
+                raise
+            # Removed since it was checked, create it again
+            self._check_bucket()
+            self._put_object(filename, content)
+
+    def _put_object(self, filename, content):
         self.client.put_object(
             ACL='private',
             Key=filename,
@@ -67,7 +110,57 @@ class TimestampWritterHandler:
         s3.put(self.s3_filename, content)
         return content
 
-    __call__ = lambda_handler
+    @staticmethod
+    def _record_id(index, record):
+        if 'messageId' in record:
+            return record['messageId']
+        if 'kinesis' in record:
+            return record['kinesis']['sequenceNumber']
+        if 'dynamodb' in record:
+            return record['dynamodb']['SequenceNumber']
+        return str(index)
+
+    def _record_filename(self, record):
+        if 'kinesis' in record:
+            body = base64.b64decode(record['kinesis']['data'])
+        else:
+            body = record.get('body') or '{}'
+        return json.loads(body).get('filename') or self.s3_filename
+
+    def batch_handler(self):
+        logger.debug('batch_handler was called')
+        failures = []
+        filenames = {}
+        for index, record in enumerate(self.event['Records']):
+            record_id = self._record_id(index, record)
+            try:
+                filename = self._record_filename(record)
+            except (AttributeError, TypeError, ValueError):
+                logger.error('Invalid record {0}'.format(record_id))
+                failures.append(record_id)
+                continue
+            filenames.setdefault(filename, []).append(record_id)
+
+        s3 = S3BucketHandler(self.s3_bucket)
+        content = self._get_timestamp()
+        # Later writes of a file overwrite the earlier ones, one is enough
+        for filename, record_ids in sorted(filenames.items()):
+            try:
+                s3.put(filename, content)
+            except Exception:
+                logger.exception('Writting {0} failed'.format(filename))
+                failures.extend(record_ids)
+
+        return {
+            'timestamp': content,
+            'batchItemFailures': [{'itemIdentifier': record_id}
+                                  for record_id in failures],
+        }
+
+    def __call__(self):
+        if isinstance(self.event, dict) and 'Records' in self.event:
+            return self.batch_handler()
+        return self.lambda_handler()
 
 
 def lambda_handler(event, context):
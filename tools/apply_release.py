@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# This script brings a function to its config file: it compares the
+# configuration, the code hash and the aliases deployed with the config and
+# the package, and only makes the calls needed to match them. Nothing is
+# published when a version with the same code and configuration exists.
+#
+# --dry-run prints the changes without making them, --warm-up warms the
+# alias up after a change (see WarmUp in the config).
+#
+from __future__ import print_function
+
+import argparse
+import sys
+
+from awslambda import AwsLambdaManager, ConfigYamlReader
+
+
+class ApplyRelease:
+    def __init__(self, configfile, alias, dry_run, warm_up=False):
+        self.config = ConfigYamlReader(configfile)
+        self.alias = alias
+        self.dry_run = dry_run
+        self.warm_up = warm_up
+        self.aws_lambda = AwsLambdaManager(self.config.config)
+
+    def __call__(self):
+        if not self.aws_lambda.function_exists():
+            print("Lambda function not found")
+            sys.exit(1)
+
+        plan = self.aws_lambda.apply(self.alias, dry_run=self.dry_run)
+        for line in plan.describe():
+            print(line)
+        if not plan:
+            print("{0} is up to date".format(
+                self.config.config['FunctionName']))
+        elif self.warm_up and not self.dry_run:
+            self.aws_lambda.warm_up(self.alias)
+        return plan
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Apply release operation')
+    parser.add_argument('configfile')
+    parser.add_argument('--alias', default='devel')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the changes without making them')
+    parser.add_argument('--warm-up', action='store_true',
+                        help='warm the alias up after a change')
+    args = parser.parse_args()
+
+    ApplyRelease(args.configfile, args.alias, args.dry_run, args.warm_up)()
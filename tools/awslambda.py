@@ -1,33 +1,292 @@
+import ast
 import base64
+import copy
+import datetime
+import hashlib
+import io
+import itertools
+import json
 import logging
+import mmap
+import multiprocessing
 import os
 from os import path
+import py_compile
+import random
+import re
+import shutil
+import stat
+import subprocess
+import struct
+import sys
+import tempfile
+import threading
+import time
 import zipfile
+import zlib
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from botocore.config import Config
 from git import Repo
 import boto3
 import yaml
 
+try:
+    from importlib.util import MAGIC_NUMBER as BYTECODE_MAGIC
+except ImportError:
+    from imp import get_magic
+    BYTECODE_MAGIC = get_magic()
+
 # Global INFO for all loggers, including boto
 logging.basicConfig(level=os.environ.get('LOG_LEVEL', logging.INFO))
 logger = logging.getLogger('LambdaManager')
 
+# Every zip entry gets the same date and permissions, so two builds of the
+# same code give the same bytes (and the same CodeSha256 in lambda)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644
 
-def _get_git_release(repo_dir='.'):
-    repo = Repo(repo_dir)
-    hash_name = repo.head.commit.hexsha
-    if len(repo.index.diff(None)) > 0:
-        # Changes not stashed
-        hash_name += 'm'
+# Files already compressed are stored as is, deflating them again only
+# burns cpu
+STORED_EXTENSIONS = (
+    '.so', '.zip', '.whl', '.egg', '.jar', '.gz', '.bz2', '.xz',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp',
+)
+
+# Below this amount of pending bytes a process pool costs more than it saves
+PARALLEL_MIN_BYTES = 1024 * 1024
+
+# Packages built in memory only go to disk above this size
+SPOOL_MAX_SIZE = 128 * 1024 * 1024
+
+# Up to this size the zip goes straight to lambda (ZipFile=), without S3
+DIRECT_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+# S3 multipart upload defaults
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_THREADS = 8
+
+# invoke_async: max events in flight and retries of a throttled event
+ASYNC_CONCURRENCY = 32
+ASYNC_RETRIES = 8
+
+# Largest payloads lambda takes for sync (RequestResponse) and async (Event)
+# invocations, checked before sending
+SYNC_PAYLOAD_LIMIT = 6 * 1024 * 1024
+ASYNC_PAYLOAD_LIMIT = 256 * 1024
+
+# Responses are read in chunks of this size, to a file or a consumer
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# Record every sync invocation in telemetry/<function> of the cache
+# directory (see telemetry.py and query_telemetry.py), for every function
+# with LAMBDA_TELEMETRY=1 or for the ones with Telemetry: true
+TELEMETRY = os.environ.get('LAMBDA_TELEMETRY', '0') == '1'
+
+# Seconds between two checks of an update of $LATEST in progress
+UPDATE_POLL_INTERVAL = 0.25
+
+# warm_up: seconds to wait for the provisioned concurrency of an alias, and
+# between two checks of its status
+PROVISIONED_READY_TIMEOUT = 900
+PROVISIONED_POLL_INTERVAL = 5
+
+# canary_release defaults (see Canary in the config): percent of the
+# traffic sent to the new version at each step, seconds of every step, the
+# regressions of the new version that roll it back, the invocations of each
+# version a step needs to compare them, and the seconds cloudwatch takes to
+# publish the metrics of the last minute
+CANARY_STEPS = [10, 50]
+CANARY_INTERVAL = 300
+CANARY_MAX_P99_INCREASE = 0.2
+CANARY_MAX_ERROR_RATE_INCREASE = 0.01
+CANARY_MIN_INVOCATIONS = 10
+CANARY_METRICS_DELAY = 60
+
+# Platform of the wheels installed in the dependency layer (see
+# DependencyLayer), the one lambda runs
+LAYER_PLATFORM = 'manylinux2014_x86_64'
+
+# Options of the shared AWS clients (see configure_clients), the read
+# timeout covers the longest sync invocation lambda allows
+CLIENT_OPTIONS = {
+    'max_pool_connections': int(os.environ.get('AWS_MAX_POOL_CONNECTIONS',
+                                               50)),
+    'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', 10)),
+    'connect_timeout': float(os.environ.get('AWS_CONNECT_TIMEOUT', 10)),
+    'read_timeout': float(os.environ.get('AWS_READ_TIMEOUT', 910)),
+}
+
+_clients_lock = threading.Lock()
+_session = None
+_clients = {}
+_known_buckets = set()
+# Account of the credentials, once per process (see client_scope)
+_account = None
+
+# Tests, docs and compiled leftovers a handler never needs, skipped from
+# the other files of a slimmed package (its modules follow the imports)
+CLUTTER_DIRECTORIES = ('test', 'tests', 'testing', 'doc', 'docs',
+                       '__pycache__')
+CLUTTER_FILES = re.compile(
+    r'^(test_.*\.py|.*_tests?\.py|conftest\.py|.*\.py[co]|.*\.(md|rst))$')
+
+# Fallback for sources written for another python version than ours
+IMPORT_RE = re.compile(
+    r'^[ \t]*(?:from[ \t]+(\.*)([\w.]*)[ \t]+import[ \t]+\(?([\w \t,*]+)'
+    r'|import[ \t]+([\w \t,.]+))', re.M)
+
+
+def _cache_directory():
+    return os.environ.get(
+        'LAMBDA_PACKAGE_CACHE',
+        path.join(path.expanduser('~'), '.cache', 'awslambda')
+    )
+
+
+def telemetry_directory(function_name):
+    return path.join(_cache_directory(), 'telemetry', function_name)
+
+
+def configure_clients(**options):
+    """
+        Change the CLIENT_OPTIONS of the shared clients, the clients
+        already created are replaced by new ones with the new options.
+    """
+    with _clients_lock:
+        CLIENT_OPTIONS.update(options)
+        _clients.clear()
+
+
+def get_client(service_name, retries=None):
+    """
+        Return the shared boto3 client of service_name. All of them come
+        from one session, keep a connection pool of max_pool_connections
+        and retry in adaptive mode (client side rate limiting when
+        throttled), or as retries says ({'mode': ..., 'max_attempts': ...},
+        a client of its own). boto3 clients are thread safe, sessions are
+        not, hence the lock.
+    """
+    global _session
+    retries = retries or {
+        'mode': 'adaptive',
+        'max_attempts': CLIENT_OPTIONS['max_attempts'],
+    }
+    key = (service_name, tuple(sorted(retries.items())))
+    with _clients_lock:
+        if key not in _clients:
+            if _session is None:
+                _session = boto3.session.Session()
+            _clients[key] = _session.client(
+                service_name,
+                config=Config(
+                    max_pool_connections=CLIENT_OPTIONS['max_pool_connections'],
+                    connect_timeout=CLIENT_OPTIONS['connect_timeout'],
+                    read_timeout=CLIENT_OPTIONS['read_timeout'],
+                    retries=retries
+                )
+            )
+        return _clients[key]
+
+
+def client_scope(client):
+    """
+        'region:account' a client works on, for the local notes of what is
+        deployed (layers, catalogs): the same name in two regions or
+        accounts is not the same thing. The stand-ins of local_aws.py have
+        the account in their meta, the account of boto3 clients comes from
+        sts.
+    """
+    global _account
+    meta = getattr(client, 'meta', None)
+    if meta is None:
+        return 'default'
+    account = getattr(meta, 'account_id', None)
+    if account is None:
+        with _clients_lock:
+            account = _account
+        if account is None:
+            account = get_client('sts').get_caller_identity()['Account']
+            with _clients_lock:
+                _account = account
+    return '{0}:{1}'.format(meta.region_name, account)
+
+
+def _directory_signature(directory, git_dir):
+    """
+        Digest of the stat (name, mtime, size) of every file in directory
+        and of the git index and HEAD: when it doesn't change, neither does
+        the release of the directory.
+    """
+    digest = hashlib.sha1()
+    for filename in (path.join(git_dir, 'HEAD'), path.join(git_dir, 'index')):
+        if path.exists(filename):
+            st = os.stat(filename)
+            digest.update('{0}\0{1}\0{2}\n'.format(
+                filename, st.st_mtime, st.st_size).encode('utf-8'))
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if name != '.git')
+        for name in sorted(files):
+            filename = path.join(root, name)
+            st = os.stat(filename)
+            digest.update('{0}\0{1}\0{2}\n'.format(
+                filename, st.st_mtime, st.st_size).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _get_git_release(directory='.'):
+    """
+        Return the release id of the code in directory: the hash of its git
+        tree in HEAD, so changes out of directory don't change it, followed
+        by 'm' if it has changes not staged (or untracked files) and 'h' if
+        it has staged changes.
+
+        The result is cached with the stat of the files in directory, so
+        calls with nothing changed don't run git at all.
+    """
+    repo = Repo(directory, search_parent_directories=True)
+    directory = path.abspath(directory)
+    head = repo.head.commit.hexsha
+
+    cache_filename = path.join(
+        _cache_directory(), 'releases',
+        hashlib.sha1(directory.encode('utf-8')).hexdigest() + '.json')
+    signature = '{0}:{1}'.format(
+        head, _directory_signature(directory, repo.git_dir))
     try:
-        if len(repo.index.diff(HEAD)) > 0:
-            # Changes added to next commit
-            hash_name += 'h'
-    except:
+        with open(cache_filename) as f:
+            cached = json.load(f)
+        if cached['signature'] == signature:
+            return cached['release']
+    except (IOError, OSError, ValueError, KeyError):
         pass
 
-    return hash_name
+    relative = path.relpath(directory, repo.working_tree_dir)
+    relative = relative.replace(os.sep, '/')
+    if relative == '.':
+        hash_name = repo.head.commit.tree.hexsha
+    else:
+        try:
+            hash_name = repo.head.commit.tree[relative].hexsha
+        except KeyError:
+            # Not in HEAD yet
+            hash_name = head + 'm'
 
+    if not hash_name.endswith('m') and (
+            repo.index.diff(None, paths=[relative]) or
+            repo.git.ls_files('--others', '--exclude-standard', '--',
+                              relative)):
+        # Changes not stashed
+        hash_name += 'm'
+    if repo.index.diff('HEAD', paths=[relative]):
+        # Changes added to next commit
+        hash_name += 'h'
+
+    if not path.isdir(path.dirname(cache_filename)):
+        os.makedirs(path.dirname(cache_filename))
+    with open(cache_filename, 'w') as f:
+        json.dump({'signature': signature, 'release': hash_name}, f)
+    return hash_name
 
 
 class ConfigYamlReader:
@@ -43,6 +302,17 @@ class ConfigYamlReader:
                S3Bucket: the-bucket-name-to-upload-releases
                S3KeyPath: route/to/releases/directory
                Directory: path/to/code/directory
+               DirectUploadMaxSize: 10485760  # optional
+               UploadPartSize: 8388608  # optional
+               UploadThreads: 8  # optional
+               Slim: true  # optional, pack only the modules used by Handler
+               KeepModules:  # optional, imported dynamically by Handler
+                   - module_name
+               Optimize: 2  # optional, -O level of the bytecode
+               CompressLevel: 9  # optional, zlib level, -1 is its default
+               Requirements: path/to/requirements.txt  # optional, layer
+               LayerName: a-layer-name  # optional, FunctionName-dependencies
+               Platform: manylinux2014_x86_64  # optional, of the wheels
             MemorySize: 128
             Timeout: 120  # optional
             VpcConfig:  # optional
@@ -55,74 +325,1104 @@ class ConfigYamlReader:
                     KEY1: VALUE1
                     KEY2: VALUE2
                     KEY3: VALUE3
+            WarmUp:  # optional, after moving an alias (see warm_up)
+                ProvisionedConcurrency:  # optional, 0 removes it
+                    production: 5
+                Invocations: 10  # optional, concurrent warm-up invocations
+                Payload: '{"warmup": true}'  # optional, json event
+            Canary:  # optional, see canary_release
+                Steps: [10, 50]  # optional, percent of traffic
+                Interval: 300  # optional, seconds per step
+                MaxP99Increase: 0.2  # optional, relative to the old p99
+                MaxErrorRateIncrease: 0.01  # optional, absolute
+                MinInvocations: 10  # optional, per version and step
+                MetricsDelay: 60  # optional, seconds before reading them
+            Telemetry: true  # optional, record the invocations
         """
         self.configfile = configfile
-        with open(self.configfile, 'r') as f:
-            self.config = yaml.load(f)
-
+        self.config = _load_config(configfile)
 
     def function_properties_check(self):
         """
-        Check the schema
+        Check the schema, raise ConfigError with every problem found
         """
-        raise NotImplementedError()
+        errors = []
+        _check_function_properties(self.config, errors)
+        if errors:
+            raise ConfigError(self.configfile, errors)
+
+
+class PayloadTooLarge(ValueError):
+
+    def __init__(self, size, limit, invocation_type):
+        self.size = size
+        self.limit = limit
+        super(PayloadTooLarge, self).__init__(
+            'Payload of {0} bytes, lambda takes up to {1} bytes in {2} '
+            'invocations'.format(size, limit, invocation_type))
+
+
+def open_payload(payload):
+    """
+        Return what to send for payload (bytes, a text or a file): a
+        regular file is mapped in memory instead of read, None is an empty
+        payload. Close the result when done if it has close (mmap).
+    """
+    if payload is None:
+        return b''
+    if not hasattr(payload, 'read'):
+        return payload if isinstance(payload, bytes) else payload.encode(
+            'utf-8')
+    try:
+        st = os.fstat(payload.fileno())
+    except (AttributeError, IOError, OSError, ValueError,
+            io.UnsupportedOperation):
+        return payload.read()
+    if not stat.S_ISREG(st.st_mode):
+        # A pipe or a terminal can't be mapped
+        return payload.read()
+    if not st.st_size:
+        return b''
+    return mmap.mmap(payload.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _check_payload(payload, invocation_type='RequestResponse'):
+    limit = (ASYNC_PAYLOAD_LIMIT if invocation_type == 'Event'
+             else SYNC_PAYLOAD_LIMIT)
+    if len(payload) > limit:
+        raise PayloadTooLarge(len(payload), limit, invocation_type)
+
+
+def _read_chunks(stream, output):
+    """
+        Copy stream to output in RESPONSE_CHUNK_SIZE chunks: output is a
+        file, a function called with every chunk, or None to keep them in a
+        BytesIO. Return (the BytesIO or None, bytes read).
+    """
+    buffer = io.BytesIO() if output is None else None
+    write = (buffer.write if output is None else
+             getattr(output, 'write', output))
+    size = 0
+    for chunk in iter(lambda: stream.read(RESPONSE_CHUNK_SIZE), b''):
+        write(chunk)
+        size += len(chunk)
+    if buffer is not None:
+        buffer.seek(0)
+    return buffer, size
+
+
+class ConfigError(ValueError):
+
+    def __init__(self, configfile, errors):
+        self.errors = errors
+        super(ConfigError, self).__init__(
+            'Invalid config {0}:\n  {1}'.format(configfile,
+                                                '\n  '.join(errors)))
+
+
+try:
+    STRING = (str, unicode)
+except NameError:
+    STRING = (str,)
+INTEGER = 'integer'
+NUMBER = 'number'
+
+
+def _compile_schema(schema, where=''):
+    """
+        Turn schema into a function(value, errors) appending to errors the
+        problems of value. The schema is one of:
+            a type or tuple of types: the value must be one of them
+            INTEGER: an int (bools are not), fitting (INTEGER, min, max)
+            NUMBER: an int or a float (bools are not), (NUMBER, min, max)
+            [schema]: a list of values of schema
+            {key: (required, schema)}: a mapping with just these keys
+            {STRING: schema}: a mapping of strings to values of schema
+    """
+    if schema in (INTEGER, NUMBER) or (isinstance(schema, tuple) and
+                                       schema[:1] in ((INTEGER,), (NUMBER,))):
+        kind, minimum, maximum = schema if isinstance(schema, tuple) else (
+            schema, None, None)
+        types, expected = {
+            INTEGER: (int, 'an integer'),
+            NUMBER: ((int, float), 'a number'),
+        }[kind]
+
+        def check_number(value, errors):
+            if isinstance(value, bool) or not isinstance(value, types):
+                errors.append('{0}: expected {1}, got {2!r}'.format(
+                    where, expected, value))
+            elif ((minimum is not None and value < minimum) or
+                  (maximum is not None and value > maximum)):
+                errors.append('{0}: {1} is out of [{2}, {3}]'.format(
+                    where, value, minimum, maximum))
+        return check_number
+
+    if isinstance(schema, list):
+        check_item = _compile_schema(schema[0], where + '[]')
+
+        def check_list(value, errors):
+            if not isinstance(value, list):
+                errors.append('{0}: expected a list, got {1!r}'.format(
+                    where, value))
+                return
+            for item in value:
+                check_item(item, errors)
+        return check_list
+
+    if isinstance(schema, dict) and list(schema) == [STRING]:
+        check_value = _compile_schema(schema[STRING], where + '.*')
+
+        def check_map(value, errors):
+            if not isinstance(value, dict):
+                errors.append('{0}: expected a mapping, got {1!r}'.format(
+                    where, value))
+                return
+            for key, item in value.items():
+                if not isinstance(key, STRING):
+                    errors.append('{0}: key {1!r} is not a string'.format(
+                        where, key))
+                check_value(item, errors)
+        return check_map
+
+    if isinstance(schema, dict):
+        required = set(key for key, (is_required, _) in schema.items()
+                       if is_required)
+        checks = dict(
+            (key, _compile_schema(item, '.'.join(filter(None, (where, key)))))
+            for key, (_, item) in schema.items())
+
+        def check_properties(value, errors):
+            if not isinstance(value, dict):
+                errors.append('{0}: expected a mapping, got {1!r}'.format(
+                    where or 'config', value))
+                return
+            for key in sorted(required - set(value)):
+                errors.append('{0}: required property missing'.format(
+                    '.'.join(filter(None, (where, key)))))
+            for key, item in value.items():
+                if key not in checks:
+                    errors.append('{0}: unknown property'.format(
+                        '.'.join(filter(None, (where, str(key))))))
+                elif item is not None or key in required:
+                    checks[key](item, errors)
+        return check_properties
+
+    def check_type(value, errors):
+        if not isinstance(value, schema):
+            errors.append('{0}: expected {1}, got {2!r}'.format(
+                where, getattr(schema, '__name__', 'a string'), value))
+    return check_type
+
+
+# Every property of a function config (see ConfigYamlReader)
+FUNCTION_SCHEMA = {
+    'FunctionName': (True, STRING),
+    'Runtime': (True, STRING),
+    'Role': (True, STRING),
+    'Handler': (True, STRING),
+    'Description': (False, STRING),
+    'Code': (True, {
+        'S3Bucket': (True, STRING),
+        'S3KeyPath': (True, STRING),
+        'Directory': (True, STRING),
+        'DirectUploadMaxSize': (False, (INTEGER, 0, None)),
+        'UploadPartSize': (False, (INTEGER, 5 * 1024 * 1024, None)),
+        'UploadThreads': (False, (INTEGER, 1, None)),
+        'Slim': (False, bool),
+        'KeepModules': (False, [STRING]),
+        'Optimize': (False, (INTEGER, 0, 2)),
+        'CompressLevel': (False, (INTEGER, -1, 9)),
+        'Requirements': (False, STRING),
+        'LayerName': (False, STRING),
+        'Platform': (False, STRING),
+    }),
+    'MemorySize': (True, (INTEGER, 128, 10240)),
+    'Timeout': (False, (INTEGER, 1, 900)),
+    'VpcConfig': (False, {
+        'SubnetIds': (True, [STRING]),
+        'SecurityGroupIds': (True, [STRING]),
+    }),
+    'Environment': (False, {
+        'Variables': (True, {STRING: STRING}),
+    }),
+    'WarmUp': (False, {
+        'ProvisionedConcurrency': (False, {STRING: (INTEGER, 0, None)}),
+        'Invocations': (False, (INTEGER, 1, 1000)),
+        'Payload': (False, STRING),
+    }),
+    'Canary': (False, {
+        'Steps': (False, [(INTEGER, 1, 99)]),
+        'Interval': (False, (INTEGER, 0, None)),
+        'MaxP99Increase': (False, NUMBER),
+        'MaxErrorRateIncrease': (False, NUMBER),
+        'MinInvocations': (False, (INTEGER, 1, None)),
+        'MetricsDelay': (False, (INTEGER, 0, None)),
+    }),
+    'Telemetry': (False, bool),
+}
+
+# Built once, checking a config is then a walk over plain closures
+_check_function_properties = _compile_schema(FUNCTION_SCHEMA)
+
+
+def _schema_text(schema):
+    """ The same text for the same schema, whatever the order of dicts """
+    if isinstance(schema, dict):
+        return '{' + ','.join(sorted(
+            '{0}:{1}'.format(_schema_text(key), _schema_text(value))
+            for key, value in schema.items())) + '}'
+    if isinstance(schema, (list, tuple)):
+        return '{0}({1})'.format(type(schema).__name__, ','.join(
+            _schema_text(item) for item in schema))
+    return getattr(schema, '__name__', repr(schema))
+
+
+# Part of the key of the configs checked in the cache directory, a config
+# is checked again when the schema changes
+_SCHEMA_DIGEST = hashlib.sha256(
+    _schema_text(FUNCTION_SCHEMA).encode('utf-8')).hexdigest()
+
+# {filename: (mtime, size, sha256, config)} of the configs already loaded
+_configs = {}
+
+
+def _load_config(configfile):
+    """
+        Return the parsed and checked config in configfile. Configs are
+        cached by mtime and size in this process, and by sha256 of their
+        content and of the schema in the cache directory, so unchanged
+        configs are neither parsed nor checked again.
+    """
+    filename = path.abspath(configfile)
+    st = os.stat(filename)
+    cached = _configs.get(filename)
+    if cached and cached[:2] == (st.st_mtime, st.st_size):
+        return copy.deepcopy(cached[3])
+
+    with open(filename, 'rb') as f:
+        content = f.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+    if cached and cached[2] == sha256:
+        config = cached[3]
+    else:
+        cache_filename = path.join(_cache_directory(), 'configs',
+                                   '{0}-{1}.json'.format(
+                                       sha256, _SCHEMA_DIGEST[:16]))
+        try:
+            with open(cache_filename) as f:
+                config = json.load(f)
+        except (IOError, OSError, ValueError):
+            config = yaml.safe_load(content)
+            errors = []
+            _check_function_properties(config, errors)
+            if errors:
+                raise ConfigError(configfile, errors)
+            if not path.isdir(path.dirname(cache_filename)):
+                os.makedirs(path.dirname(cache_filename))
+            with open(cache_filename, 'w') as f:
+                json.dump(config, f)
+
+    _configs[filename] = (st.st_mtime, st.st_size, sha256, config)
+    return copy.deepcopy(config)
+
+
+def _deflate(data, level=zlib.Z_DEFAULT_COMPRESSION):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_type(arcname):
+    if arcname.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _file_sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest
+
+
+def _compile_source(filename, arcname, optimize=-1):
+    """
+        Return the bytecode of filename as it would be stored in a .pyc,
+        without the source timestamp so the result is reproducible.
+
+        optimize is the -O level (python 3 only): 1 drops asserts and 2
+        docstrings too.
+    """
+    fd, cfile = tempfile.mkstemp(suffix='.pyc')
+    os.close(fd)
+    try:
+        if hasattr(py_compile, 'PycInvalidationMode'):
+            py_compile.compile(
+                filename, cfile=cfile, dfile=arcname, doraise=True,
+                optimize=optimize,
+                invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+            with open(cfile, 'rb') as f:
+                return f.read()
+
+        py_compile.compile(filename, cfile=cfile, dfile=arcname,
+                           doraise=True)
+        with open(cfile, 'rb') as f:
+            bytecode = f.read()
+        # magic (4 bytes) + mtime (4 bytes): zipimport only checks the mtime
+        # against a .py in the same archive, and we don't ship it
+        return bytecode[:4] + b'\0\0\0\0' + bytecode[8:]
+    finally:
+        os.remove(cfile)
+
+
+def _build_entry(job):
+    """
+        Compile (for .pyc entries) and compress one package entry. It runs
+        in the packaging process pool, so it only gets and returns plain data:
+
+        (filename, arcname, compile_source, level, optimize) ->
+            (arcname, compress_type, crc, file_size, data, cacheable)
+    """
+    filename, arcname, compile_source, level, optimize = job
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    cacheable = True
+    if compile_source:
+        try:
+            content = _compile_source(filename, arcname[:-1], optimize)
+        except py_compile.PyCompileError as e:
+            # Same fallback as writepy: ship the source, don't cache it
+            logger.error(e.msg)
+            arcname = arcname[:-1]
+            cacheable = False
+
+    compress_type = _compress_type(arcname)
+    crc = zlib.crc32(content) & 0xffffffff
+    if compress_type == zipfile.ZIP_DEFLATED:
+        data = _deflate(content, level)
+    else:
+        data = content
+    return arcname, compress_type, crc, len(content), data, cacheable
+
+
+def _build_entries(jobs, workers):
+    """ Run _build_entry for every job, keeping the jobs order """
+    pending_bytes = sum(path.getsize(job[0]) for job in jobs)
+    if workers > 1 and pending_bytes >= PARALLEL_MIN_BYTES:
+        logger.debug("Compressing {0} entries with {1} workers".format(
+            len(jobs), workers))
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(_build_entry, jobs))
+    return [_build_entry(job) for job in jobs]
+
+
+def _find_imports(source):
+    """ Return [(level, module, names)] for every import in source """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        imports = []
+        for dots, module, names, plain in IMPORT_RE.findall(
+                source.decode('utf-8', 'replace')):
+            if plain:
+                imports.extend((0, name.split()[0], ())
+                               for name in plain.split(',') if name.strip())
+            else:
+                imports.append((len(dots), module, tuple(
+                    name.split()[0] for name in names.split(',')
+                    if name.strip())))
+        return imports
+
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend((0, alias.name, ()) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append((node.level or 0, node.module or '',
+                            tuple(alias.name for alias in node.names)))
+    return imports
+
+
+def _reachable_modules(modules, roots):
+    """
+        Walk the import graph of modules ({module_name: filename}) from the
+        roots module names and return the names of the modules reached.
+        Imports of modules not in modules (stdlib, boto3...) are ignored.
+    """
+    reached = set()
+    pending = list(roots)
+    while pending:
+        name = pending.pop()
+        if name in reached or name not in modules:
+            continue
+        reached.add(name)
+
+        # Importing a.b.c imports a and a.b first
+        parts = name.split('.')
+        pending.extend('.'.join(parts[:i]) for i in range(1, len(parts)))
+
+        filename = modules[name]
+        if path.basename(filename) == '__init__.py':
+            package = name
+        else:
+            package = name.rpartition('.')[0]
+
+        with open(filename, 'rb') as f:
+            imports = _find_imports(f.read())
+        for level, module, names in imports:
+            if level:
+                base = package.split('.') if package else []
+                base = base[:len(base) - level + 1]
+                module = '.'.join(base + ([module] if module else []))
+            elif package:
+                # python 2 implicit relative import
+                pending.append(package + '.' + module)
+            if module:
+                pending.append(module)
+                pending.extend(module + '.' + item for item in names)
+            else:
+                pending.extend(names)
+    return reached
+
+
+def _iter_pyfiles(directory, prefix=''):
+    """
+        Yield (filename, arcname) for the modules writepy would pack: the
+        top level modules and every package below directory.
+    """
+    for name in sorted(os.listdir(directory)):
+        filename = path.join(directory, name)
+        if path.isdir(filename):
+            if path.isfile(path.join(filename, '__init__.py')):
+                for item in _iter_pyfiles(filename, prefix + name + '/'):
+                    yield item
+        elif name.endswith('.py'):
+            yield filename, prefix + name + 'c'
+
+
+def _is_clutter(arcname):
+    parts = arcname.split('/')
+    return (any(part in CLUTTER_DIRECTORIES for part in parts[:-1]) or
+            bool(CLUTTER_FILES.match(parts[-1])))
+
+
+def _zipinfo(arcname, compress_type=zipfile.ZIP_DEFLATED):
+    zinfo = zipfile.ZipInfo(arcname, ZIP_DATE_TIME)
+    zinfo.compress_type = compress_type
+    zinfo.create_system = 3
+    zinfo.external_attr = ZIP_FILE_MODE << 16
+    return zinfo
+
+
+def _write_raw_entry(zipf, arcname, crc, file_size, data,
+                     compress_type=zipfile.ZIP_DEFLATED):
+    """
+        Append an entry whose data is already compressed to an open zipfile
+    """
+    zinfo = _zipinfo(arcname, compress_type)
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(data)
+    zinfo.CRC = crc
+
+    if hasattr(zipf, 'start_dir'):
+        zipf.fp.seek(zipf.start_dir)
+    zinfo.header_offset = zipf.fp.tell()
+    zipf._writecheck(zinfo)
+    zipf._didModify = True
+    zipf.fp.write(zinfo.FileHeader())
+    zipf.fp.write(data)
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+    if hasattr(zipf, 'start_dir'):
+        zipf.start_dir = zipf.fp.tell()
+
+
+class PackageCache:
+    """
+        Local content addressed store of compiled and deflated zip entries.
+
+        Entries are keyed by the source contents, its name in the archive
+        and the packaging options, so an unchanged module is copied into the
+        new package as is, without compiling or compressing it again.
+    """
+
+    ENTRY_HEADER = struct.Struct('<IQ')
+
+    def __init__(self, directory=None):
+        self.directory = directory or _cache_directory()
+        self.entries_directory = path.join(self.directory, 'entries')
+        if not path.isdir(self.entries_directory):
+            os.makedirs(self.entries_directory)
+
+    @staticmethod
+    def key(arcname, content, options):
+        digest = hashlib.sha256()
+        digest.update(repr(options).encode('utf-8'))
+        digest.update(arcname.encode('utf-8'))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return path.join(self.entries_directory, key[:2], key)
+
+    def get(self, key):
+        """ Return (crc, file_size, compressed_data) or None """
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                crc, file_size = self.ENTRY_HEADER.unpack(
+                    f.read(self.ENTRY_HEADER.size))
+                return crc, file_size, f.read()
+        except (IOError, OSError, struct.error):
+            return None
+
+    def put(self, key, crc, file_size, data):
+        entry_path = self._entry_path(key)
+        if not path.isdir(path.dirname(entry_path)):
+            os.makedirs(path.dirname(entry_path))
+        # Write and rename, so a concurrent build never reads half an entry
+        tmp_path = '{0}.{1}.tmp'.format(entry_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(self.ENTRY_HEADER.pack(crc, file_size))
+            f.write(data)
+        os.rename(tmp_path, entry_path)
 
 
 class LambdaPackage:
 
     def __init__(self, package_name, release, source_directory,
-                 target_directory='.'):
+                 target_directory='.', cache=None, workers=None,
+                 compress_level=zlib.Z_DEFAULT_COMPRESSION, handler=None,
+                 keep_modules=(), runtime=None, optimize=0):
+        """
+            target_directory: where the zip is written, None keeps it in a
+                spooled memory buffer (see getfile)
+            handler: the lambda Handler (module.function). When set, only the
+                modules imported from it (and keep_modules, for dynamic
+                imports) are packed, tests and docs never
+            runtime: the lambda Runtime (python2.7, python3.6...). If it
+                isn't the python running this, the sources are packed
+                instead of bytecode the runtime can't load
+            optimize: -O level of the bytecode (python 3 only)
+            workers: size of the process pool compressing the entries
+                (default: one per cpu, 1 disables the pool)
+            compress_level: zlib level for the deflated entries
+        """
         self.package_name = package_name
         self.release = release
         self.source_directory = source_directory
         self.target_directory = target_directory
+        self.cache = cache
+        self.workers = workers or multiprocessing.cpu_count()
+        self.compress_level = compress_level
+        self.handler = handler
+        self.keep_modules = keep_modules
+        self.compile_bytecode = runtime in (
+            None, 'python{0}.{1}'.format(*sys.version_info[:2]))
+        self.optimize = optimize
+        # [(arcname, source size, packed size)], packed size 0 if dropped
+        self.report = []
 
         self.filename = "{package_name}-{release}.zip".format(
             target_directory=target_directory,
             package_name=package_name,
             release=release)
 
+        if target_directory is None:
+            self.fileobj = tempfile.SpooledTemporaryFile(
+                max_size=SPOOL_MAX_SIZE)
+        else:
+            self.fileobj = None
+
         self.zipf = zipfile.PyZipFile(
-            path.join(target_directory, self.filename),
+            self.fileobj or path.join(target_directory, self.filename),
             'w',
             zipfile.ZIP_DEFLATED)
-        self.zipf.writestr('PACKAGE_NAME', package_name)
-        self.zipf.writestr('RELEASE', release)
+        self.zipf.writestr(_zipinfo('PACKAGE_NAME'), package_name)
+        self.zipf.writestr(_zipinfo('RELEASE'), release)
+
+    def _iter_pyfiles(self, directory=None, prefix=''):
+        return _iter_pyfiles(directory or self.source_directory, prefix)
+
+    def _slim(self, pyfiles):
+        """ Keep the pyfiles reachable from the handler """
+        names = []
+        for filename, arcname in pyfiles:
+            name = arcname[:-len('.pyc')].replace('/', '.')
+            if name.endswith('.__init__'):
+                name = name[:-len('.__init__')]
+            names.append(name)
+        modules = dict(zip(names, (filename for filename, _ in pyfiles)))
+
+        roots = [self.handler.rpartition('.')[0]] + list(self.keep_modules)
+        reached = _reachable_modules(modules, roots)
+
+        kept = []
+        for (filename, arcname), name in zip(pyfiles, names):
+            if name in reached:
+                kept.append((filename, arcname))
+            else:
+                logger.debug("Dropping {0}, not imported by {1}".format(
+                    arcname, self.handler))
+                self.report.append((arcname, path.getsize(filename), 0))
+        return kept
+
+    def log_report(self):
+        """ Log the size of each module, and what the packaging saved """
+        total_source = total_packed = 0
+        for arcname, source_size, packed_size in sorted(
+                self.report, key=lambda item: item[2] - item[1]):
+            logger.info("{0:<40} {1:>9} -> {2:>9} ({3:+d})".format(
+                arcname, source_size, packed_size, packed_size - source_size))
+            total_source += source_size
+            total_packed += packed_size
+        logger.info("Package modules: {0} -> {1} bytes ({2:+d})".format(
+            total_source, total_packed, total_packed - total_source))
+
+    def _build_entries(self, jobs):
+        return _build_entries(jobs, self.workers)
+
+    def _write_entries(self, entries):
+        for arcname, compress_type, crc, file_size, data, _ in entries:
+            _write_raw_entry(self.zipf, arcname, crc, file_size, data,
+                             compress_type)
 
     def add_pyfiles(self):
-        oldpwd = os.getcwd()
-        os.chdir(path.basename(self.source_directory))
-        self.zipf.writepy('.')
-        os.chdir(oldpwd)
+        options = (self.zipf.compression, self.compress_level,
+                   BYTECODE_MAGIC, ZIP_DATE_TIME, self.compile_bytecode,
+                   self.optimize)
+        pyfiles = list(self._iter_pyfiles())
+        if self.handler:
+            pyfiles = self._slim(pyfiles)
+        if not self.compile_bytecode:
+            pyfiles = [(filename, arcname[:-1])
+                       for filename, arcname in pyfiles]
+
+        entries = []
+        jobs = []
+        keys = []
+        for filename, arcname in pyfiles:
+            entry = key = None
+            if self.cache:
+                with open(filename, 'rb') as f:
+                    key = self.cache.key(arcname, f.read(), options)
+                entry = self.cache.get(key)
+            if entry is not None:
+                crc, file_size, data = entry
+                entries.append((arcname, zipfile.ZIP_DEFLATED, crc,
+                                file_size, data, True))
+            else:
+                # Placeholder, replaced once the entry is built
+                entries.append(None)
+                jobs.append((filename, arcname, self.compile_bytecode,
+                             self.compress_level, self.optimize))
+                keys.append((len(entries) - 1, key))
+
+        built = self._build_entries(jobs)
+        for (position, key), entry in zip(keys, built):
+            entries[position] = entry
+            _, _, crc, file_size, data, cacheable = entry
+            if self.cache and cacheable:
+                self.cache.put(key, crc, file_size, data)
+
+        self._write_entries(entries)
+        logger.info("Package entries: {0} reused from cache, {1} built".format(
+            len(entries) - len(jobs), len(jobs)))
+        for (filename, _), entry in zip(pyfiles, entries):
+            self.report.append((entry[0], path.getsize(filename),
+                                len(entry[4])))
 
     def add_otherfiles(self, files):
-        for filename in files:
-            self.zipf.write(filename)
+        jobs = []
+        for filename in sorted(files):
+            arcname = path.normpath(path.splitdrive(filename)[1])
+            arcname = arcname.lstrip(os.sep).replace(os.sep, '/')
+            if self.handler and _is_clutter(arcname):
+                continue
+            jobs.append((filename, arcname, False, self.compress_level,
+                         self.optimize))
+        self._write_entries(self._build_entries(jobs))
 
     def save(self):
         self.zipf.close()
 
+    def getfile(self):
+        """ File object with the saved package, at its start """
+        if self.fileobj is None:
+            return open(path.join(self.target_directory, self.filename), 'rb')
+        self.fileobj.seek(0)
+        return self.fileobj
+
+    def size(self):
+        f = self.getfile()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if f is not self.fileobj:
+            f.close()
+        return size
+
+    def sha256(self):
+        """ Digest of the saved package """
+        if self.fileobj is None:
+            return _file_sha256(
+                path.join(self.target_directory, self.filename))
+        digest = hashlib.sha256()
+        f = self.getfile()
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+        return digest
+
+
+class IncrementalPackage:
+    """
+        Package of the modules of a directory (like LambdaPackage, without
+        Slim) kept in memory as built entries. update builds again only the
+        files changed since the last call, and the zip is then written from
+        the entries already compressed, which takes milliseconds.
+
+        It has the getfile, size and sha256 of LambdaPackage, so it can be
+        given to AwsLambdaManager.set_package.
+    """
+
+    def __init__(self, package_name, release, source_directory,
+                 runtime=None, optimize=0,
+                 compress_level=zlib.Z_DEFAULT_COMPRESSION):
+        self.package_name = package_name
+        self.release = release
+        self.source_directory = source_directory
+        self.filename = "{0}-{1}.zip".format(package_name, release)
+        self.compile_bytecode = runtime in (
+            None, 'python{0}.{1}'.format(*sys.version_info[:2]))
+        self.optimize = optimize
+        self.compress_level = compress_level
+        # {filename: (mtime, size)} and {filename: entry} of the last update
+        self.stats = {}
+        self.entries = {}
+        self.fileobj = io.BytesIO()
+
+    def scan(self):
+        """ {filename: (arcname, (mtime, size))} of the modules now """
+        files = {}
+        for filename, arcname in _iter_pyfiles(self.source_directory):
+            if not self.compile_bytecode:
+                arcname = arcname[:-1]
+            try:
+                st = os.stat(filename)
+            except OSError:
+                # Removed while listing
+                continue
+            files[filename] = (arcname, (st.st_mtime, st.st_size))
+        return files
+
+    def changed(self, files=None):
+        """ Filenames added, changed or removed since the last update """
+        files = self.scan() if files is None else files
+        return sorted(
+            [filename for filename, (_, stat_) in files.items()
+             if self.stats.get(filename) != stat_] +
+            [filename for filename in self.stats if filename not in files])
+
+    def update(self):
+        """
+            Build the entries of the files changed and write the zip again,
+            return the filenames changed (nothing is written without them)
+        """
+        files = self.scan()
+        changed = self.changed(files)
+        if not changed:
+            return changed
+
+        for filename in changed:
+            if filename not in files:
+                del self.stats[filename]
+                del self.entries[filename]
+                continue
+            arcname, stat_ = files[filename]
+            try:
+                self.entries[filename] = _build_entry(
+                    (filename, arcname, self.compile_bytecode,
+                     self.compress_level, self.optimize))
+            except (IOError, OSError):
+                # Removed after the scan, next update drops it
+                continue
+            self.stats[filename] = stat_
+        self._write()
+        return changed
+
+    def _write(self):
+        self.fileobj = io.BytesIO()
+        zipf = zipfile.ZipFile(self.fileobj, 'w', zipfile.ZIP_DEFLATED)
+        zipf.writestr(_zipinfo('PACKAGE_NAME'), self.package_name)
+        zipf.writestr(_zipinfo('RELEASE'), self.release)
+        for arcname, compress_type, crc, file_size, data, _ in sorted(
+                self.entries.values()):
+            _write_raw_entry(zipf, arcname, crc, file_size, data,
+                             compress_type)
+        zipf.close()
+
+    def getfile(self):
+        self.fileobj.seek(0)
+        return self.fileobj
+
+    def size(self):
+        return len(self.fileobj.getvalue())
+
+    def sha256(self):
+        return hashlib.sha256(self.fileobj.getvalue())
+
+
+class DependencyLayer:
+    """
+        The requirements file of a function installed for its runtime and
+        published as a lambda layer, so the function zip only has its own
+        code.
+
+        Everything is keyed by the sha256 of the requirements file, the
+        runtime and the platform: the wheels pip downloads are kept in
+        wheels/ of the cache directory, shared by every layer, the zip in
+        layers/<hash>.zip and the LayerVersionArn published for it in
+        layers/<hash>.json, per region and account (see client_scope). Until the requirements change nothing is
+        installed nor published again. Versions should be pinned, only the
+        file itself is hashed.
+    """
+
+    def __init__(self, requirements, runtime, layer_name,
+                 platform=LAYER_PLATFORM):
+        self.requirements = requirements
+        self.runtime = runtime
+        self.layer_name = layer_name
+        self.platform = platform
+        self.directory = path.join(_cache_directory(), 'layers')
+        with open(requirements, 'rb') as f:
+            digest = hashlib.sha256(f.read())
+        digest.update("\0{0}\0{1}".format(runtime, platform).encode('utf-8'))
+        self.hash = digest.hexdigest()
+        self.filename = path.join(self.directory, self.hash + '.zip')
+        self.description = 'requirements sha256:{0}'.format(self.hash)
+        # Stands for the arn in the configuration until it is published
+        self.unpublished_arn = '{0}:(unpublished {1})'.format(
+            layer_name, self.hash[:12])
+
+    def _pip(self, *args):
+        command = [sys.executable, '-m', 'pip'] + list(args) + [
+            '--requirement', self.requirements,
+            '--only-binary=:all:',
+            '--platform', self.platform,
+            '--implementation', 'cp',
+            '--python-version', self.runtime[len('python'):],
+        ]
+        logger.debug("Running {0}".format(" ".join(command)))
+        subprocess.check_call(command)
+
+    def build(self):
+        """
+            Install the requirements under python/ (where lambda looks for
+            them in a layer) and zip them, once per hash. Return the zip
+            filename.
+        """
+        if path.isfile(self.filename):
+            return self.filename
+        if not path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        logger.info("Installing {0} for {1}".format(self.requirements,
+                                                     self.runtime))
+        wheels = path.join(_cache_directory(), 'wheels')
+        target = tempfile.mkdtemp(dir=self.directory)
+        try:
+            self._pip('download', '--dest', wheels)
+            self._pip('install', '--no-index', '--find-links', wheels,
+                      '--target', path.join(target, 'python'))
+
+            jobs = []
+            for root, directories, filenames in os.walk(target):
+                directories[:] = sorted(directory for directory in directories
+                                        if directory != '__pycache__')
+                for filename in sorted(filenames):
+                    if filename.endswith(('.pyc', '.pyo')):
+                        continue
+                    filename = path.join(root, filename)
+                    arcname = path.relpath(filename, target).replace(
+                        os.sep, '/')
+                    jobs.append((filename, arcname, False,
+                                 zlib.Z_DEFAULT_COMPRESSION, 0))
+
+            tmp_filename = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+            with zipfile.ZipFile(tmp_filename, 'w',
+                                 zipfile.ZIP_DEFLATED) as zipf:
+                for arcname, compress_type, crc, file_size, data, _ in \
+                        _build_entries(jobs, multiprocessing.cpu_count()):
+                    _write_raw_entry(zipf, arcname, crc, file_size, data,
+                                     compress_type)
+            os.rename(tmp_filename, self.filename)
+        finally:
+            shutil.rmtree(target, True)
+        return self.filename
+
+    def _load_arns(self):
+        try:
+            with open(path.join(self.directory, self.hash + '.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _record_key(self, aws_lambda):
+        return '{0}:{1}'.format(client_scope(aws_lambda), self.layer_name)
+
+    def _save_arn(self, aws_lambda, arn):
+        arns = self._load_arns()
+        arns[self._record_key(aws_lambda)] = arn
+        if not path.isdir(self.directory):
+            os.makedirs(self.directory)
+        filename = path.join(self.directory, self.hash + '.json')
+        tmp_filename = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump(arns, f)
+        os.rename(tmp_filename, filename)
+
+    def find_published(self, aws_lambda):
+        """ LayerVersionArn of a version already published with the hash """
+        kwargs = {'LayerName': self.layer_name}
+        while True:
+            try:
+                response = aws_lambda.list_layer_versions(**kwargs)
+            except aws_lambda.exceptions.ResourceNotFoundException:
+                return None
+            for version in response.get('LayerVersions', []):
+                if version.get('Description') == self.description:
+                    return version['LayerVersionArn']
+            if not response.get('NextMarker'):
+                return None
+            kwargs['Marker'] = response['NextMarker']
+
+    def published(self, aws_lambda):
+        """
+            LayerVersionArn of the requirements when a layer version has
+            them already (noted locally, or found in lambda), else None.
+            Nothing is built nor published.
+        """
+        arn = self._load_arns().get(self._record_key(aws_lambda))
+        if arn is None:
+            arn = self.find_published(aws_lambda)
+            if arn is not None:
+                self._save_arn(aws_lambda, arn)
+        return arn
+
+    def publish(self, aws_lambda, s3_bucket, s3_key_path,
+                direct_max_size=DIRECT_UPLOAD_MAX_SIZE):
+        """
+            Return the LayerVersionArn of the requirements, building and
+            publishing a new layer version only when no version has this
+            hash yet. Zips above direct_max_size go through
+            s3://s3_bucket/s3_key_path.
+        """
+        arn = self.published(aws_lambda)
+        if arn is not None:
+            logger.info("Layer {0} is up to date".format(arn))
+            return arn
+
+        filename = self.build()
+        if path.getsize(filename) <= direct_max_size:
+            with open(filename, 'rb') as f:
+                content = {'ZipFile': f.read()}
+        else:
+            s3_filename = path.join(s3_key_path, path.basename(filename))
+            S3FunctionUploader(s3_bucket).upload(filename, s3_filename)
+            content = {'S3Bucket': s3_bucket, 'S3Key': s3_filename}
+
+        arn = aws_lambda.publish_layer_version(
+            LayerName=self.layer_name,
+            Description=self.description,
+            Content=content,
+            CompatibleRuntimes=[self.runtime],
+        )['LayerVersionArn']
+        logger.info("Published layer {0}".format(arn))
+        self._save_arn(aws_lambda, arn)
+        return arn
+
+
+class AdaptiveLimiter:
+    """
+        Bound the calls in flight to a window that shrinks by half when the
+        service throttles and grows back by one per window of successes
+        (AIMD), never above max_concurrency.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.window = float(max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.window):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.window = max(1.0, self.window / 2)
+            else:
+                self.window = min(float(self.max_concurrency),
+                                  self.window + 1.0 / self.window)
+            self.condition.notify_all()
+
 
 class S3FunctionUploader:
 
-    def __init__(self, bucket_name):
-        self.s3_client = boto3.client('s3')
+    def __init__(self, bucket_name, s3_client=None):
+        """
+            s3_client replaces the shared client, i.e. with LocalS3Client
+        """
+        self.s3_client = s3_client or get_client('s3')
         self.bucket = bucket_name
 
-        if not any(
-            item['Name'] == self.bucket
-            for item in self.s3_client.list_buckets().get('Buckets', [])
-        ):
+        if self.bucket not in _known_buckets:
+            self._check_bucket()
+
+    def _check_bucket(self):
+        """ Create the bucket if it doesn't exist, once per process """
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket)
+        except self.s3_client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchBucket'):
+                raise
             logger.debug('Creating bucket s3://{0}'.format(self.bucket))
             self.s3_client.create_bucket(
                 ACL='private',
                 Bucket=self.bucket
             )
+        _known_buckets.add(self.bucket)
 
-    def upload(self, local_filename, s3_filename):
-        """ Stream the zip called local_filename to s3://bucket/s3_filename """
+    def remote_sha256(self, s3_filename):
+        """ sha256 stored in the metadata of s3://bucket/s3_filename """
+        try:
+            response = self.s3_client.head_object(
+                Bucket=self.bucket,
+                Key=s3_filename
+            )
+        except self.s3_client.exceptions.ClientError:
+            return None
+        return response.get('Metadata', {}).get('sha256')
+
+    def upload(self, local_filename, s3_filename, sha256=None):
+        """
+            Stream the zip called local_filename to s3://bucket/s3_filename
+
+            The upload is skipped when the object already has the same
+            sha256. Return True if the file was uploaded.
+        """
+        sha256 = sha256 or _file_sha256(local_filename).hexdigest()
+        if self.remote_sha256(s3_filename) == sha256:
+            logger.info('s3://{0}/{1} is up to date, upload skipped'.format(
+                self.bucket, s3_filename))
+            return False
 
-        logger.debug('writting file {0} into {1}/'.format(
+        logger.debug('writting file {0} into {1}/{2}'.format(
             local_filename,
             self.bucket,
             s3_filename)
@@ -131,12 +1431,425 @@ class S3FunctionUploader:
         self.s3_client.upload_file(
             local_filename,
             self.bucket,
-            s3_filename)
+            s3_filename,
+            ExtraArgs={'Metadata': {'sha256': sha256}})
+        return True
+
+    def _journal_filename(self, s3_filename, sha256):
+        """ Local note of the multipart upload in progress for a package """
+        location = hashlib.sha256('{0}/{1}'.format(
+            self.bucket, s3_filename).encode('utf-8')).hexdigest()
+        return path.join(_cache_directory(), 'uploads',
+                         '{0}-{1}.json'.format(location[:16], sha256))
+
+    def _uploaded_parts(self, s3_filename, upload_id):
+        """ Return {part_number: etag} already uploaded for upload_id """
+        parts = {}
+        paginator = self.s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=s3_filename,
+                                       UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag'].strip('"')
+        return parts
+
+    def _start_multipart(self, s3_filename, sha256):
+        """
+            Return (upload_id, uploaded_parts), resuming the upload of the
+            same package interrupted before if there is one
+        """
+        journal = self._journal_filename(s3_filename, sha256)
+        try:
+            with open(journal) as f:
+                upload_id = json.load(f)['UploadId']
+            parts = self._uploaded_parts(s3_filename, upload_id)
+            logger.info('Resuming upload of s3://{0}/{1} ({2} parts '
+                        'found)'.format(self.bucket, s3_filename, len(parts)))
+            return upload_id, parts
+        except (IOError, OSError, ValueError, KeyError,
+                self.s3_client.exceptions.NoSuchUpload):
+            pass
+
+        upload_id = self.s3_client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=s3_filename,
+            ACL='private',
+            Metadata={'sha256': sha256}
+        )['UploadId']
+        if not path.isdir(path.dirname(journal)):
+            os.makedirs(path.dirname(journal))
+        with open(journal, 'w') as f:
+            json.dump({'UploadId': upload_id}, f)
+        return upload_id, {}
+
+    def upload_fileobj(self, fileobj, s3_filename, sha256,
+                       part_size=UPLOAD_PART_SIZE, threads=UPLOAD_THREADS):
+        """
+            Send fileobj to s3://bucket/s3_filename with a concurrent
+            multipart upload of part_size parts using threads threads.
+
+            The parts already in S3 from an interrupted upload of the same
+            package (same sha256) are not sent again. Return True if
+            something was uploaded.
+        """
+        if self.remote_sha256(s3_filename) == sha256:
+            logger.info('s3://{0}/{1} is up to date, upload skipped'.format(
+                self.bucket, s3_filename))
+            return False
+
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        if size <= part_size:
+            self.s3_client.put_object(
+                ACL='private',
+                Bucket=self.bucket,
+                Key=s3_filename,
+                Body=fileobj.read(),
+                Metadata={'sha256': sha256}
+            )
+            return True
+
+        upload_id, uploaded = self._start_multipart(s3_filename, sha256)
+        lock = threading.Lock()
+
+        def upload_part(part_number):
+            with lock:
+                fileobj.seek((part_number - 1) * part_size)
+                data = fileobj.read(part_size)
+            etag = hashlib.md5(data).hexdigest()
+            if uploaded.get(part_number) == etag:
+                etag = '"{0}"'.format(etag)
+            else:
+                etag = self.s3_client.upload_part(
+                    Bucket=self.bucket,
+                    Key=s3_filename,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data
+                )['ETag']
+            return {'PartNumber': part_number, 'ETag': etag}
+
+        part_numbers = range(1, (size + part_size - 1) // part_size + 1)
+        logger.debug('Uploading {0} parts into s3://{1}/{2}'.format(
+            len(part_numbers), self.bucket, s3_filename))
+        with ThreadPoolExecutor(threads) as executor:
+            parts = list(executor.map(upload_part, part_numbers))
+
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=s3_filename,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        os.remove(self._journal_filename(s3_filename, sha256))
+        return True
+
+
+def build_package(config, release, directory=None, package_name=None,
+                  target_directory=None):
+    """
+        Build and save the LambdaPackage of the function in config (see
+        AwsLambdaManager), with the packaging options of its Code block.
+        directory and package_name default to Code.Directory and
+        FunctionName.
+    """
+    code = config['Code']
+    lp = LambdaPackage(package_name or config['FunctionName'],
+                       release,
+                       directory or code['Directory'],
+                       target_directory=target_directory,
+                       cache=PackageCache(),
+                       handler=config['Handler'] if code.get('Slim') else None,
+                       keep_modules=code.get('KeepModules', ()),
+                       runtime=config['Runtime'],
+                       optimize=code.get('Optimize', 0),
+                       compress_level=code.get('CompressLevel',
+                                               zlib.Z_DEFAULT_COMPRESSION))
+    lp.add_pyfiles()
+    lp.save()
+    if code.get('Slim'):
+        lp.log_report()
+    return lp
+
+
+def parse_report(log):
+    """
+        Return the numbers of the REPORT line in an invocation log, i.e.
+        {'Duration': 1.5, 'Billed Duration': 2.0, 'Memory Size': 128.0,
+         'Max Memory Used': 40.0, 'Init Duration': 250.1} (ms and MB), with
+        Init Duration only for cold starts. {} when there is no REPORT line.
+    """
+    for line in log.splitlines():
+        if not line.startswith('REPORT '):
+            continue
+        fields = {}
+        for field in line[len('REPORT '):].split('\t'):
+            name, _, value = field.partition(': ')
+            try:
+                fields[name.strip()] = float(value.split()[0])
+            except (IndexError, ValueError):
+                pass
+        return fields
+    return {}
+
+
+def _latency_summary(invocations):
+    """ Count, mean and max of the latencies and durations (ms) """
+    summary = {'count': len(invocations)}
+    for key in ('latency', 'duration', 'init_duration'):
+        values = [item[key] for item in invocations if item.get(key)]
+        if values:
+            summary[key] = {'mean': sum(values) / len(values),
+                            'max': max(values)}
+    return summary
+
+
+def _normalized_configuration(definition):
+    """
+        The configurable properties of a function, from a config
+        (get_function_configuration) or from lambda (what it reports of a
+        version), with the lambda defaults for the missing ones so both
+        compare equal when nothing changed.
+    """
+    vpc_config = definition.get('VpcConfig') or {}
+    environment = definition.get('Environment') or {}
+    # Arns in a config, {'Arn': ..., 'CodeSize': ...} from lambda
+    layers = [layer['Arn'] if isinstance(layer, dict) else layer
+              for layer in definition.get('Layers') or []]
+    normalized = {
+        'Runtime': definition.get('Runtime'),
+        'Role': definition.get('Role'),
+        'Handler': definition.get('Handler'),
+        'Description': definition.get('Description') or '',
+        'MemorySize': definition.get('MemorySize') or 128,
+        'Timeout': definition.get('Timeout') or 3,
+        'VpcConfig': {
+            'SubnetIds': sorted(vpc_config.get('SubnetIds') or []),
+            'SecurityGroupIds': sorted(
+                vpc_config.get('SecurityGroupIds') or []),
+        },
+        'Environment': {
+            'Variables': dict(environment.get('Variables') or {}),
+        },
+    }
+    # Only with layers, the digests of the versions without them stay the
+    # same
+    if layers:
+        normalized['Layers'] = layers
+    return normalized
+
+
+def _configuration_digest(configuration):
+    return hashlib.sha1(json.dumps(configuration, sort_keys=True).encode(
+        'utf-8')).hexdigest()
+
+
+class DeployPlan:
+    """
+        Ordered API calls bringing a function to its config, see
+        AwsLambdaManager.plan. describe gives the diff for a dry run, apply
+        makes the calls; an empty plan means there is nothing to do.
+    """
+
+    def __init__(self, function_name):
+        self.function_name = function_name
+        # [(description, call)]
+        self.steps = []
+        # Filled while applying, i.e. the version published
+        self.state = {}
+
+    def add(self, description, call):
+        self.steps.append((description, call))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def describe(self):
+        return [line for description, _ in self.steps
+                for line in description.splitlines()]
+
+    def apply(self):
+        """ Make the calls, return the version the aliases point at """
+        for description, call in self.steps:
+            for line in description.splitlines():
+                logger.info("{0}: {1}".format(self.function_name, line))
+            call()
+        return self.state.get('version')
+
+
+class LambdaCatalog:
+    """
+        Local index of the aliases and published versions of a function,
+        saved in the cache directory between runs.
+
+        refresh pages through aliases and versions at the same time. Versions
+        never change once published, so only the pages after the last one
+        seen are fetched again; aliases can move and are listed completely.
+        When an alias points at a version the index doesn't have (deleted
+        and published again), versions are listed completely too. Lookups
+        are then answered from memory.
+
+        There is one index per region and account (see client_scope).
+    """
+
+    PAGE_SIZE = 10000
+
+    def __init__(self, aws_lambda, function_name, filename=None):
+        self.aws_lambda = aws_lambda
+        self.function_name = function_name
+        self.filename = filename or path.join(
+            _cache_directory(), 'catalog',
+            client_scope(aws_lambda).replace(':', '-'),
+            function_name + '.json')
+        # {alias: version}
+        self.aliases = {}
+        # {alias: the alias as list_aliases reports it (AliasArn,
+        #          RoutingConfig, Description...)}
+        self.alias_items = {}
+        # {version: {'CodeSha256': ..., 'Description': ...,
+        #            'ConfigurationDigest': ...}}
+        self.versions = {}
+        # Marker of the last page of versions, where the refresh starts
+        self.versions_marker = None
+        self._index()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        self.aliases = data['aliases']
+        self.alias_items = data.get('alias_items', {})
+        self.versions = data['versions']
+        self.versions_marker = data['versions_marker']
+        self._index()
+
+    def save(self):
+        if not path.isdir(path.dirname(self.filename)):
+            os.makedirs(path.dirname(self.filename))
+        tmp_filename = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump({
+                'aliases': self.aliases,
+                'alias_items': self.alias_items,
+                'versions': self.versions,
+                'versions_marker': self.versions_marker,
+            }, f)
+        os.rename(tmp_filename, self.filename)
+
+    def _index(self):
+        self.version_aliases = {}
+        for alias, version in self.aliases.items():
+            self.version_aliases.setdefault(version, []).append(alias)
+        self.code_versions = {}
+        for version, properties in self.versions.items():
+            self.code_versions.setdefault(properties['CodeSha256'],
+                                          []).append(version)
+
+    def _list_aliases(self):
+        """ Return {alias: item of list_aliases} """
+        aliases = {}
+        kwargs = {'FunctionName': self.function_name,
+                  'MaxItems': self.PAGE_SIZE}
+        while True:
+            response = self.aws_lambda.list_aliases(**kwargs)
+            for item in response['Aliases']:
+                aliases[item['Name']] = item
+            if not response.get('NextMarker'):
+                return aliases
+            kwargs['Marker'] = response['NextMarker']
+
+    def _list_versions(self, marker):
+        """ Return ({version: properties}, marker of the last page) """
+        versions = {}
+        kwargs = {'FunctionName': self.function_name,
+                  'MaxItems': self.PAGE_SIZE}
+        if marker:
+            kwargs['Marker'] = marker
+        while True:
+            response = self.aws_lambda.list_versions_by_function(**kwargs)
+            for item in response['Versions']:
+                if item['Version'] != '$LATEST':
+                    versions[item['Version']] = {
+                        'CodeSha256': item['CodeSha256'],
+                        'Description': item.get('Description', ''),
+                        'ConfigurationDigest': _configuration_digest(
+                            _normalized_configuration(item)),
+                    }
+            if not response.get('NextMarker'):
+                return versions, kwargs.get('Marker')
+            kwargs['Marker'] = response['NextMarker']
+
+    def refresh(self, full=False):
+        """ Update the index from lambda, return self """
+        marker = None if full else self.versions_marker
+        with ThreadPoolExecutor(2) as executor:
+            aliases = executor.submit(self._list_aliases)
+            versions = executor.submit(self._list_versions, marker)
+            self.alias_items = aliases.result()
+            self.aliases = dict((name, item['FunctionVersion'])
+                                for name, item in self.alias_items.items())
+            try:
+                new_versions, self.versions_marker = versions.result()
+            except self.aws_lambda.exceptions.InvalidParameterValueException:
+                # The saved marker isn't valid anymore
+                self.versions = {}
+                new_versions, self.versions_marker = self._list_versions(None)
+
+        if full:
+            self.versions = new_versions
+        else:
+            self.versions.update(new_versions)
+            missing = [version for version in self.aliases.values()
+                       if version not in self.versions and version.isdigit()]
+            if missing:
+                logger.info("Versions {0} aren't in the catalog, listing "
+                            "all of them".format(', '.join(sorted(missing))))
+                return self.refresh(full=True)
+        self._index()
+        self.save()
+        return self
+
+    def version_of(self, alias):
+        """ Version the alias points at, None if there is no such alias """
+        return self.aliases.get(alias)
+
+    def aliases_of(self, version):
+        return sorted(self.version_aliases.get(str(version), []))
+
+    def version_for_release(self, release):
+        """ Version published by create_release for the release hash """
+        return self.aliases.get(release)
+
+    def versions_for_code(self, code_sha256):
+        return sorted(self.code_versions.get(code_sha256, []), key=int)
+
+    def versions_matching(self, code_sha256, configuration_digest):
+        """ Versions published with this code and this configuration """
+        return [version for version in self.versions_for_code(code_sha256)
+                if self.versions[version].get('ConfigurationDigest') ==
+                configuration_digest]
+
+    def set_alias(self, alias, version):
+        """ Record an alias change made by us """
+        self.aliases[alias] = version
+        if alias in self.alias_items:
+            self.alias_items[alias]['FunctionVersion'] = version
+        self._index()
+        self.save()
+
+    def resolve(self, qualifier):
+        """ Version of a qualifier (version number, $LATEST or alias) """
+        if qualifier.isdigit() or qualifier == '$LATEST':
+            return qualifier
+        return self.version_of(qualifier)
 
 
 class AwsLambdaManager:
 
-    def __init__(self, config):
+    def __init__(self, config, aws_lambda=None, cloudwatch=None):
         """
             config = {
                 'FunctionName': 'the_visible_lambda_function_name',
@@ -148,6 +1861,16 @@ class AwsLambdaManager:
                    'S3Bucket': 'the-bucket-name-to-upload-releases',
                    'S3KeyPath': 'route/to/releases/directory',
                    'Directory': 'path/to/code/directory',
+                   'DirectUploadMaxSize': 10485760,  # optional
+                   'UploadPartSize': 8388608,  # optional
+                   'UploadThreads': 8,  # optional
+                   'Slim': True,  # optional
+                   'KeepModules': ['module_name'],  # optional
+                   'Optimize': 2,  # optional
+                   'CompressLevel': 9,  # optional
+                   'Requirements': 'path/to/requirements.txt',  # optional
+                   'LayerName': 'a-layer-name',  # optional
+                   'Platform': 'manylinux2014_x86_64',  # optional
                 },
                 'MemorySize': 128,
                 'Timeout': 120,  # optional
@@ -166,10 +1889,29 @@ class AwsLambdaManager:
                         'KEY3': 'VALUE3',
                     }
                 },
+                'WarmUp': {  # optional
+                    'ProvisionedConcurrency': {'production': 5},  # optional
+                    'Invocations': 10,  # optional
+                    'Payload': '{"warmup": true}',  # optional
+                },
+                'Canary': {  # optional
+                    'Steps': [10, 50],  # optional
+                    'Interval': 300,  # optional
+                    'MaxP99Increase': 0.2,  # optional
+                    'MaxErrorRateIncrease': 0.01,  # optional
+                    'MinInvocations': 10,  # optional
+                    'MetricsDelay': 60,  # optional
+                },
+                'Telemetry': True,  # optional
             }
+
+            aws_lambda and cloudwatch replace the shared clients, i.e. with
+            the stand-ins of local_aws.py
         """
         self.config = config
-        self.aws_lambda = boto3.client('lambda')
+        self.aws_lambda = aws_lambda or get_client('lambda')
+        self._cloudwatch = cloudwatch
+        self._event_client = aws_lambda
 
     def get_function_configuration(self):
         """
@@ -199,33 +1941,115 @@ class AwsLambdaManager:
             if self.config.get(key)
         })
 
+        layer = self.dependency_layer()
+        if layer:
+            function_definition['Layers'] = [layer]
+
         return function_definition
 
+    def _requirements_layer(self):
+        """ The DependencyLayer of Code.Requirements, None without them """
+        code = self.config['Code']
+        if not code.get('Requirements'):
+            return None
+        if getattr(self, '_requirements', None) is None:
+            layer_name = code.get('LayerName', '{0}-dependencies'.format(
+                self.config['FunctionName']))
+            self._requirements = DependencyLayer(
+                code['Requirements'], self.config['Runtime'], layer_name,
+                platform=code.get('Platform', LAYER_PLATFORM))
+        return self._requirements
+
+    def dependency_layer(self):
+        """
+            LayerVersionArn of the Code.Requirements of the function (see
+            DependencyLayer), or its unpublished_arn when they changed and
+            are not published yet (see publish_dependency_layer). None
+            without requirements. Nothing is built nor published.
+        """
+        layer = self._requirements_layer()
+        if layer is None:
+            return None
+        if getattr(self, '_dependency_layer', None) is None:
+            self._dependency_layer = layer.published(self.aws_lambda)
+            if self._dependency_layer is None:
+                return layer.unpublished_arn
+        return self._dependency_layer
+
+    def publish_dependency_layer(self):
+        """
+            Build and publish the layer of Code.Requirements when they
+            changed, return its LayerVersionArn (None without requirements)
+        """
+        layer = self._requirements_layer()
+        if layer is None:
+            return None
+        code = self.config['Code']
+        self._dependency_layer = layer.publish(
+            self.aws_lambda,
+            code['S3Bucket'],
+            path.join(code['S3KeyPath'], 'layers'),
+            code.get('DirectUploadMaxSize', DIRECT_UPLOAD_MAX_SIZE))
+        return self._dependency_layer
+
     def create_package(self, directory, package_name, release_tag=''):
         """ Create a temporary zip package"""
 
-        hash_release = _get_git_release()
+        hash_release = _get_git_release(directory)
         logger.info("Creating package with git release {0}".format(hash_release))
 
-        lp = LambdaPackage(package_name,
-                           hash_release + release_tag,
-                           directory,
-                           target_directory='.')
-        lp.add_pyfiles()
-        lp.save()
+        lp = build_package(self.config, hash_release + release_tag,
+                           directory=directory, package_name=package_name)
+        self.set_package(lp, hash_release)
+
+    def set_package(self, package, hash_release):
+        """ Use a package already built, i.e. shared with other functions """
         self.hash_release = hash_release
-        self.local_filename = lp.filename
+        self.package = package
+        self.local_filename = package.filename
+        self.local_sha256 = package.sha256()
 
     def upload_package(self, filename=None):
-        """ Upload the package to S3 """
+        """
+            Upload the package to S3: the file called filename, or the
+            package built in memory by create_package
+        """
         logger.info("Uploading the package to S3")
         s3f = S3FunctionUploader(self.config['Code']['S3Bucket'])
         self.s3_filename = path.join(
             self.config['Code']['S3KeyPath'],
             path.basename(filename or self.local_filename)
         )
-        s3f.upload(filename or self.local_filename,
-                   self.s3_filename)
+        if filename:
+            s3f.upload(filename, self.s3_filename)
+        else:
+            s3f.upload_fileobj(
+                self.package.getfile(),
+                self.s3_filename,
+                self.local_sha256.hexdigest(),
+                part_size=self.config['Code'].get('UploadPartSize',
+                                                  UPLOAD_PART_SIZE),
+                threads=self.config['Code'].get('UploadThreads',
+                                                UPLOAD_THREADS)
+            )
+
+    def package_code(self):
+        """
+            Return the lambda Code arguments for the package: the zip
+            itself when it is small enough, else its S3 location once
+            uploaded
+        """
+        direct_max_size = self.config['Code'].get('DirectUploadMaxSize',
+                                                  DIRECT_UPLOAD_MAX_SIZE)
+        if self.package.size() <= direct_max_size:
+            logger.info("Sending the package directly to lambda")
+            return {'ZipFile': self.package.getfile().read()}
+
+        self.upload_package()
+        return {
+            'S3Bucket': self.config['Code']['S3Bucket'],
+            'S3Key': self.s3_filename,
+        }
 
 
     def create_function(self):
@@ -237,15 +2061,11 @@ class AwsLambdaManager:
             'devel'
         )
 
-        self.upload_package()
-
+        self.publish_dependency_layer()
         function_definition = self.get_function_configuration()
 
         # Set the first release Code block
-        function_definition['Code'] = {
-            'S3Bucket': self.config['Code']['S3Bucket'],
-            'S3Key': self.s3_filename,
-        }
+        function_definition['Code'] = self.package_code()
 
         function_definition['Publish'] = True
 
@@ -264,6 +2084,39 @@ class AwsLambdaManager:
         except self.aws_lambda.exceptions.ResourceNotFoundException:
             return False
 
+    def deployed_version(self, code_sha256, qualifier):
+        """
+            Return the version behind qualifier if it already runs the code
+            with code_sha256 (base64, as reported by lambda) and the
+            configuration of $LATEST, what publishing would freeze, else
+            None
+        """
+        try:
+            response = self.aws_lambda.get_function_configuration(
+                FunctionName=self.config['FunctionName'],
+                Qualifier=qualifier
+            )
+        except self.aws_lambda.exceptions.ResourceNotFoundException:
+            return None
+        if response.get('CodeSha256') != code_sha256:
+            return None
+        latest = self.aws_lambda.get_function_configuration(
+            FunctionName=self.config['FunctionName'])
+        if (_normalized_configuration(response) !=
+                _normalized_configuration(latest)):
+            return None
+        return response['Version']
+
+    def version_exists(self, version):
+        try:
+            self.aws_lambda.get_function_configuration(
+                FunctionName=self.config['FunctionName'],
+                Qualifier=version
+            )
+        except self.aws_lambda.exceptions.ResourceNotFoundException:
+            return False
+        return True
+
     def create_release(self, alias="devel"):
         """
             publish version in lambda with alias "tag"
@@ -272,25 +2125,38 @@ class AwsLambdaManager:
             self.config['Code']['Directory'],
             self.config['FunctionName']
         )
+        return self.release_package(alias)
 
-        self.upload_package()
-
-        logger.info("Creating release {0}".format(self.hash_release))
+    def release_package(self, alias="devel", code=None):
+        """
+            publish the package (see create_package and set_package) in
+            lambda with alias "tag", return the version.
+                code: the lambda Code arguments of the package when they are
+                    already prepared (see package_code)
+        """
+        code_sha256 = base64.b64encode(self.local_sha256.digest()).decode()
+        version = self.deployed_version(code_sha256, alias)
+        if version:
+            logger.info("Version {0} already runs this code and "
+                        "configuration, reusing it".format(version))
+        else:
+            logger.info("Creating release {0}".format(self.hash_release))
 
-        response_code = self.aws_lambda.update_function_code(
-            FunctionName=self.config['FunctionName'],
-            S3Bucket=self.config['Code']['S3Bucket'],
-            S3Key=self.s3_filename,
-            Publish=True
-        )
+            response_code = self.aws_lambda.update_function_code(
+                FunctionName=self.config['FunctionName'],
+                Publish=True,
+                **(code or self.package_code())
+            )
+            version = response_code['Version']
 
-        logger.info("Created revision {0}".format(response_code['Version']))
+            logger.info("Created revision {0}".format(version))
 
-        self.update_or_create_alias(response_code['Version'], self.hash_release)
-        self.update_or_create_alias(response_code['Version'], alias)
+        self.update_or_create_alias(version, self.hash_release)
+        self.update_or_create_alias(version, alias)
 
         logger.info("If config wash changed, remember to update function "
                     "configuration")
+        return version
 
 
     def update_or_create_alias(self, version, alias):
@@ -311,72 +2177,716 @@ class AwsLambdaManager:
             logger.info("Alias '{0}' created for version '{1}'".format(
                 alias, version
             ))
+        if getattr(self, '_catalog', None) is not None:
+            self._catalog.set_alias(alias, version)
+
+    def configuration_changes(self, live):
+        """
+            Return {property: (live value, config value)} of the properties
+            that differ between the config and live, the configuration
+            lambda reports
+        """
+        current = _normalized_configuration(live)
+        desired = _normalized_configuration(self.get_function_configuration())
+        # Layers is the only one that can be missing, see
+        # _normalized_configuration
+        return {
+            key: (current.get(key, []), desired.get(key, []))
+            for key in set(current) | set(desired)
+            if current.get(key, []) != desired.get(key, [])
+        }
+
+    def _wait_updated(self):
+        """ Wait until lambda is done with the last update of $LATEST """
+        while True:
+            response = self.aws_lambda.get_function_configuration(
+                FunctionName=self.config['FunctionName'])
+            if response.get('LastUpdateStatus') != 'InProgress':
+                return response
+            time.sleep(UPDATE_POLL_INTERVAL)
 
-    def update_function_configuration(self):
+    def update_latest(self):
         """
-            update function configuration without code update
+            Send the package (see create_package and set_package) to
+            $LATEST without publishing a version, and wait until it can be
+            invoked. Skipped when $LATEST already runs it. Return True when
+            the code was updated.
+        """
+        code_sha256 = base64.b64encode(self.local_sha256.digest()).decode()
+        live = self.aws_lambda.get_function_configuration(
+            FunctionName=self.config['FunctionName'])
+        if live['CodeSha256'] == code_sha256:
+            return False
+        self.aws_lambda.update_function_code(
+            FunctionName=self.config['FunctionName'],
+            Publish=False,
+            **self.package_code()
+        )
+        self._wait_updated()
+        return True
+
+    def set_memory_size(self, memory_size):
+        """
+            Change the MemorySize of $LATEST only, i.e. to measure it, and
+            wait until lambda applies it
+        """
+        logger.info("Setting MemorySize {0}".format(memory_size))
+        self.aws_lambda.update_function_configuration(
+            FunctionName=self.config['FunctionName'],
+            MemorySize=memory_size
+        )
+        return self._wait_updated()
+
+    def update_function_configuration(self, live=None):
+        """
+            update function configuration without code update, sending
+            only the properties that changed. Return the changes.
+                live: the configuration of $LATEST when already fetched
         """
 
         logger.info("Update function config")
-        function_definition = self.get_function_configuration()
+        self.publish_dependency_layer()
+        if live is None:
+            live = self.aws_lambda.get_function_configuration(
+                FunctionName=self.config['FunctionName'])
+        changes = self.configuration_changes(live)
+        if not changes:
+            logger.info("Function config already up to date")
+            return changes
 
+        function_definition = {
+            key: desired for key, (_, desired) in changes.items()
+        }
         self.aws_lambda.update_function_configuration(
+            FunctionName=self.config['FunctionName'],
             **function_definition
         )
+        return changes
 
-    def list_aliases(self):
-        logger.info("Listing aliases")
-        response = self.aws_lambda.list_aliases(
-            FunctionName=self.config['FunctionName'],
-            MaxItems=500
+    def plan(self, alias="devel"):
+        """
+            Compare the function deployed with the config and the package
+            (see create_package), return the DeployPlan of the calls making
+            them match: the layer of Code.Requirements when they changed,
+            configuration and code updates of $LATEST, a new
+            version when no published one has both already, and the moves
+            of the release and alias aliases. Nothing is changed until the
+            plan is applied.
+        """
+        function_name = self.config['FunctionName']
+        live = self.aws_lambda.get_function_configuration(
+            FunctionName=function_name)
+        catalog = self.catalog.refresh()
+
+        code_sha256 = base64.b64encode(self.local_sha256.digest()).decode()
+        changes = self.configuration_changes(live)
+        digest = _configuration_digest(
+            _normalized_configuration(self.get_function_configuration()))
 
+        plan = DeployPlan(function_name)
+        layer = self._requirements_layer()
+        if layer is not None and (self.dependency_layer() ==
+                                  layer.unpublished_arn):
+            plan.add("+ layer {0} ({1})".format(layer.layer_name,
+                                                layer.description),
+                     self.publish_dependency_layer)
+        if changes:
+            plan.add("\n".join(
+                "~ configuration {0}: {1} -> {2}".format(
+                    key, json.dumps(current, sort_keys=True),
+                    json.dumps(desired, sort_keys=True))
+                for key, (current, desired) in sorted(changes.items())),
+                lambda: (self.update_function_configuration(live),
+                         self._wait_updated()))
+
+        if live['CodeSha256'] != code_sha256:
+            plan.add("~ code: {0} -> {1} ({2} bytes)".format(
+                live['CodeSha256'], code_sha256, self.package.size()),
+                lambda: (self.aws_lambda.update_function_code(
+                    FunctionName=function_name,
+                    Publish=False,
+                    **self.package_code()
+                ), self._wait_updated()))
+
+        versions = catalog.versions_matching(code_sha256, digest)
+        current = catalog.version_of(alias)
+        if (versions and current not in versions and
+                not self.version_exists(versions[-1])):
+            # Deleted since the catalog saw it
+            versions = catalog.refresh(full=True).versions_matching(
+                code_sha256, digest)
+        if plan or not versions:
+            def publish():
+                plan.state['version'] = self.aws_lambda.publish_version(
+                    FunctionName=function_name,
+                    CodeSha256=code_sha256
+                )['Version']
+                logger.info("Created revision {0}".format(
+                    plan.state['version']))
+            plan.add("+ version (release {0})".format(self.hash_release),
+                     publish)
+            target = None
+        else:
+            # Already published, prefer the version the alias is at
+            target = current if current in versions else versions[-1]
+            plan.state['version'] = target
+
+        for name in (self.hash_release, alias):
+            version = catalog.version_of(name)
+            if target is not None and version == target:
+                continue
+            plan.add("~ alias {0}: {1} -> {2}".format(
+                name, version or '(none)', target or '(new version)'),
+                lambda name=name: self.update_or_create_alias(
+                    plan.state['version'], name))
+        return plan
+
+    def apply(self, alias="devel", dry_run=False):
+        """
+            Build the package and bring the function to the config (see
+            plan), return the plan. A dry run only computes it.
+        """
+        self.create_package(
+            self.config['Code']['Directory'],
+            self.config['FunctionName']
         )
-        return response
+        plan = self.plan(alias)
+        if not plan:
+            logger.info("{0} is up to date".format(self.config['FunctionName']))
+        elif not dry_run:
+            plan.apply()
+        return plan
+
+    @property
+    def catalog(self):
+        """ The LambdaCatalog of the function, loaded on first use """
+        if getattr(self, '_catalog', None) is None:
+            self._catalog = LambdaCatalog(self.aws_lambda,
+                                          self.config['FunctionName'])
+        return self._catalog
+
+    def list_aliases(self):
+        """ The aliases as list_aliases reports them, sorted by name """
+        logger.info("Listing aliases")
+        self.catalog.refresh()
+        return {
+            'Aliases': [
+                item for _, item in sorted(self.catalog.alias_items.items())
+            ]
+        }
 
     def promote_release(self, release):
         """
-            update alias "production" to "release"
+            update alias "production" to "release", return its version
         """
         logger.info("Updating production alias with revision '{0}'".format(
                     release))
-        if release.isdigit() or release == '$LATEST':
-            version = release
-        else:
-            try:
-                response = self.aws_lambda.get_alias(
-                    FunctionName=self.config['FunctionName'],
-                    Name=release
-                )
-                version = response['FunctionVersion']
-            except self.aws_lambda.exceptions.ResourceNotFoundException:
-                logger.error("Can't found the qualifier {0} for {1}".format(
-                    release,
-                    self.config['FunctionName']
-                ))
-                return
+        # Aliases move, the index must be fresh to resolve them
+        version = self.catalog.refresh().resolve(release)
+        if version is None:
+            logger.error("Can't found the qualifier {0} for {1}".format(
+                release,
+                self.config['FunctionName']
+            ))
+            return
 
         self.update_or_create_alias(version, 'production')
+        return version
 
-    def invoke_sync(self, qualifier, payload):
+    @property
+    def cloudwatch(self):
+        if self._cloudwatch is None:
+            self._cloudwatch = get_client('cloudwatch')
+        return self._cloudwatch
+
+    def version_metrics(self, alias, version, start, end):
         """
-            Call in sync mode to the function
-                payload is a file.
+            Invocations, errors, error rate and p99 duration (ms) of the
+            invocations of alias run by version between start and end
+            (timestamps), from the lambda metrics in cloudwatch
         """
-        response =  self.aws_lambda.invoke(
+        function_name = self.config['FunctionName']
+        dimensions = [
+            {'Name': 'FunctionName', 'Value': function_name},
+            {'Name': 'Resource',
+             'Value': '{0}:{1}'.format(function_name, alias)},
+            {'Name': 'ExecutedVersion', 'Value': str(version)},
+        ]
+        # One datapoint for the whole window
+        period = max(60, int(end - start + 59) // 60 * 60)
+
+        def datapoints(metric, **kwargs):
+            return self.cloudwatch.get_metric_statistics(
+                Namespace='AWS/Lambda',
+                MetricName=metric,
+                Dimensions=dimensions,
+                StartTime=datetime.datetime.utcfromtimestamp(start),
+                EndTime=datetime.datetime.utcfromtimestamp(end),
+                Period=period,
+                **kwargs
+            )['Datapoints']
+
+        invocations = sum(point['Sum'] for point in
+                          datapoints('Invocations', Statistics=['Sum']))
+        errors = sum(point['Sum'] for point in
+                     datapoints('Errors', Statistics=['Sum']))
+        p99 = max([point['ExtendedStatistics']['p99'] for point in
+                   datapoints('Duration', ExtendedStatistics=['p99'])] or [0])
+        return {
+            'invocations': invocations,
+            'errors': errors,
+            'error_rate': float(errors) / invocations if invocations else 0.0,
+            'p99': p99,
+        }
+
+    def _route_alias(self, alias, version, weights=None):
+        """ Point alias at version, sending weights {version: share} off """
+        self.aws_lambda.update_alias(
             FunctionName=self.config['FunctionName'],
-            InvocationType='RequestResponse',
-            LogType='Tail',
-            Payload=payload or bytes(''),
-            Qualifier=qualifier
+            Name=alias,
+            FunctionVersion=version,
+            RoutingConfig={'AdditionalVersionWeights': weights or {}}
         )
-        response['LogResultDecoded'] = base64.decodestring(
-            response['LogResult'])
-        return response
 
-    def invoke_async(self, revision, payload):
+    def canary_release(self, release, alias='production'):
+        """
+            Move alias to release (a version or an alias) step by step,
+            following the Canary config: at every step the new version gets
+            that percent of the traffic of alias during Interval seconds,
+            then its p99 duration and error rate are compared with the ones
+            of the old version, once cloudwatch had MetricsDelay seconds to
+            publish them. When they regress more than MaxP99Increase
+            (relative) or MaxErrorRateIncrease (absolute), or a version ran
+            less than MinInvocations times so there is nothing to compare,
+            all the traffic goes back to the old version.
+
+            Return (version of alias at the end, [metrics of every step]).
+        """
+        canary = self.config.get('Canary') or {}
+        steps = canary.get('Steps', CANARY_STEPS)
+        interval = canary.get('Interval', CANARY_INTERVAL)
+        max_p99_increase = canary.get('MaxP99Increase',
+                                      CANARY_MAX_P99_INCREASE)
+        max_error_rate_increase = canary.get('MaxErrorRateIncrease',
+                                             CANARY_MAX_ERROR_RATE_INCREASE)
+        min_invocations = canary.get('MinInvocations',
+                                     CANARY_MIN_INVOCATIONS)
+        metrics_delay = canary.get('MetricsDelay', CANARY_METRICS_DELAY)
+
+        catalog = self.catalog.refresh()
+        new = catalog.resolve(release)
+        old = catalog.version_of(alias)
+        if new is None:
+            logger.error("Can't found the qualifier {0} for {1}".format(
+                release, self.config['FunctionName']))
+            return old, []
+        if old is None or old == new:
+            self.update_or_create_alias(new, alias)
+            return new, []
+
+        history = []
+        for percent in steps:
+            logger.info("Canary {0}: {1}% of {2} to version {3}".format(
+                self.config['FunctionName'], percent, alias, new))
+            self._route_alias(alias, old, {new: percent / 100.0})
+            start = time.time()
+            time.sleep(interval)
+            end = time.time()
+            # The traffic keeps its split while the metrics arrive
+            time.sleep(metrics_delay)
+
+            step = {
+                'percent': percent,
+                'old': self.version_metrics(alias, old, start, end),
+                'new': self.version_metrics(alias, new, start, end),
+            }
+            history.append(step)
+            logger.info("Canary step {0}%: p99 {1:.2f} -> {2:.2f} ms, error "
+                        "rate {3:.4f} -> {4:.4f}".format(
+                            percent, step['old']['p99'], step['new']['p99'],
+                            step['old']['error_rate'],
+                            step['new']['error_rate']))
+
+            failures = []
+            if min(step['old']['invocations'],
+                   step['new']['invocations']) < min_invocations:
+                failures.append('less than {0} invocations to '
+                                'compare'.format(min_invocations))
+            else:
+                if step['new']['p99'] > step['old']['p99'] * (
+                        1 + max_p99_increase):
+                    failures.append('p99 regressed')
+                if step['new']['error_rate'] > (step['old']['error_rate'] +
+                                                max_error_rate_increase):
+                    failures.append('error rate regressed')
+            if failures:
+                logger.error("Canary of version {0} failed ({1}), rolling "
+                             "{2} back to version {3}".format(
+                                 new, ', '.join(failures), alias, old))
+                self._route_alias(alias, old)
+                catalog.set_alias(alias, old)
+                return old, history
+
+        self._route_alias(alias, new)
+        catalog.set_alias(alias, new)
+        logger.info("Alias '{0}' updated for version '{1}'".format(
+            alias, new))
+        return new, history
+
+    @property
+    def telemetry(self):
+        """
+            The TelemetryStore of the function, None unless Telemetry or
+            LAMBDA_TELEMETRY enable it
+        """
+        if (getattr(self, '_telemetry', None) is None and
+                self.config.get('Telemetry', TELEMETRY)):
+            from telemetry import open_store
+            self._telemetry = open_store(
+                telemetry_directory(self.config['FunctionName']))
+        return getattr(self, '_telemetry', None)
+
+    def _invoke(self, qualifier, payload, output=None):
+        """
+            Sync invocation recorded in the telemetry, return the response
+            and the invocation (see timed_invoke). The response Payload is
+            read in chunks to output (see _read_chunks), its Payload is then
+            a BytesIO, or None when it went to output.
+        """
+        _check_payload(payload)
+        start = time.time()
+        try:
+            response = self.aws_lambda.invoke(
+                FunctionName=self.config['FunctionName'],
+                InvocationType='RequestResponse',
+                LogType='Tail',
+                Payload=payload,
+                Qualifier=qualifier
+            )
+            response['Payload'], response_size = _read_chunks(
+                response['Payload'], output)
+        except Exception as e:
+            if self.telemetry:
+                self.telemetry.append(start, qualifier, None,
+                                      (time.time() - start) * 1000,
+                                      payload_size=len(payload),
+                                      error=type(e).__name__)
+            raise
+        latency = (time.time() - start) * 1000
+
+        report = parse_report(base64.b64decode(
+            response.get('LogResult', '')).decode('utf-8', 'replace'))
+        invocation = {
+            'latency': latency,
+            'version': response.get('ExecutedVersion'),
+            'duration': report.get('Duration'),
+            'billed_duration': report.get('Billed Duration'),
+            'init_duration': report.get('Init Duration'),
+            'max_memory_used': report.get('Max Memory Used'),
+            'error': response.get('FunctionError'),
+        }
+        if self.telemetry:
+            self.telemetry.append(
+                start, qualifier, invocation['version'], latency,
+                duration=invocation['duration'],
+                billed_duration=invocation['billed_duration'],
+                init_duration=invocation['init_duration'],
+                max_memory_used=invocation['max_memory_used'],
+                memory_size=report.get('Memory Size'),
+                payload_size=len(payload),
+                response_size=response_size,
+                error=invocation['error'])
+        return response, invocation
+
+    def invoke_sync(self, qualifier, payload, output=None):
         """
             Call in sync mode to the function
-                payload is a file.
+                payload is a file (mapped in memory, not read), bytes or
+                    None, see open_payload.
+                output: file or function the response payload is written
+                    to in chunks, see _read_chunks.
+            Raise PayloadTooLarge over the lambda limit, without calling it.
+        """
+        payload = open_payload(payload)
+        try:
+            response, _ = self._invoke(qualifier, payload, output)
+        finally:
+            if hasattr(payload, 'close'):
+                payload.close()
+        response['LogResultDecoded'] = base64.b64decode(
+            response.get('LogResult', '')).decode('utf-8', 'replace')
+        return response
+
+    def invoke_batch(self, qualifier, payloads, output=None,
+                     concurrency=1):
+        """
+            Call in sync mode to the function once per line of payloads (a
+            JSONL file or an iterable of lines), read one line at a time,
+            with up to concurrency calls in flight. The response payloads
+            are written to output (a file), one per line in the order of the
+            payloads: line N of output answers line N of payloads. Empty
+            lines, payloads over the lambda limit and failed calls are
+            logged and get an error line, like the payload of a function
+            error ({"errorMessage": ..., "errorType": ...}). Return the
+            count of sent and failed events.
+        """
+        counts = {'sent': 0, 'failed': 0}
+
+        def error_line(number, message, error_type):
+            logger.error("Payload {0} failed: {1}".format(number, message))
+            return None, json.dumps({
+                'errorMessage': message,
+                'errorType': error_type,
+                'payloadLine': number,
+            }).encode('utf-8')
+
+        def send(item):
+            number, payload = item
+            if not payload:
+                return error_line(number, 'Empty payload', 'EmptyPayload')
+            try:
+                response, invocation = self._invoke(qualifier, payload)
+            except Exception as e:
+                return error_line(number, str(e), type(e).__name__)
+            if invocation['error']:
+                logger.error("Payload {0} failed: {1}".format(
+                    number, invocation['error']))
+            return True, response['Payload'].getvalue()
+
+        def lines():
+            for number, line in enumerate(payloads, 1):
+                if not isinstance(line, bytes):
+                    line = line.encode('utf-8')
+                yield number, line.strip()
+
+        logger.info("Sending payloads to {0}:{1}".format(
+            self.config['FunctionName'], qualifier))
+        items = lines()
+        with ThreadPoolExecutor(concurrency) as executor:
+            while True:
+                # A window of payloads at a time, the file isn't loaded
+                window = list(itertools.islice(items, concurrency * 4))
+                if not window:
+                    break
+                for sent, body in executor.map(send, window):
+                    counts['sent' if sent else 'failed'] += 1
+                    if output:
+                        output.write(body.replace(b'\n', b' ') + b'\n')
+
+        logger.info("{sent} payloads sent, {failed} failed".format(**counts))
+        return counts
+
+    @property
+    def event_client(self):
+        """
+            Lambda client of invoke_async, without botocore retries:
+            _invoke_event retries itself, and its AdaptiveLimiter has to
+            see every throttle
+        """
+        if getattr(self, '_event_client', None) is None:
+            self._event_client = get_client('lambda', retries={
+                'mode': 'standard',
+                'max_attempts': 1,
+            })
+        return self._event_client
+
+    def _invoke_event(self, qualifier, payload, limiter):
+        """
+            Send one Event invocation, retrying with backoff while lambda
+            throttles. Return None or the error of the last try.
+        """
+        client = self.event_client
+        retryable = (client.exceptions.TooManyRequestsException,
+                     client.exceptions.ServiceException)
+        for attempt in range(ASYNC_RETRIES + 1):
+            limiter.acquire()
+            try:
+                client.invoke(
+                    FunctionName=self.config['FunctionName'],
+                    InvocationType='Event',
+                    Payload=payload,
+                    Qualifier=qualifier
+                )
+            except retryable as e:
+                limiter.release(throttled=True)
+                error = e
+                # Exponential backoff with full jitter, up to 20 seconds
+                time.sleep(random.uniform(0, min(20, 0.1 * 2 ** attempt)))
+                continue
+            except Exception as e:
+                limiter.release()
+                return e
+            limiter.release()
+            return None
+        return error
+
+    def timed_invoke(self, qualifier, payload):
+        """
+            Sync invocation, return {'latency': ms seen by us, 'version'
+            executed, and from the REPORT line 'duration',
+            'billed_duration', 'init_duration' (ms, None when warm),
+            'max_memory_used' (MB), 'error': FunctionError or None}
+        """
+        return self._invoke(qualifier, payload)[1]
+
+    def set_provisioned_concurrency(self, alias, executions):
+        """
+            Set the provisioned concurrency of alias (0 removes it) and wait
+            until lambda reports it ready, return the seconds waited
+        """
+        function_name = self.config['FunctionName']
+        if not executions:
+            logger.info("Removing provisioned concurrency of {0}".format(
+                alias))
+            try:
+                self.aws_lambda.delete_provisioned_concurrency_config(
+                    FunctionName=function_name, Qualifier=alias)
+            except self.aws_lambda.exceptions.ResourceNotFoundException:
+                pass
+            return 0.0
+
+        logger.info("Provisioning {0} executions for {1}".format(
+            executions, alias))
+        self.aws_lambda.put_provisioned_concurrency_config(
+            FunctionName=function_name,
+            Qualifier=alias,
+            ProvisionedConcurrentExecutions=executions
+        )
+        start = time.time()
+        while True:
+            response = self.aws_lambda.get_provisioned_concurrency_config(
+                FunctionName=function_name, Qualifier=alias)
+            if response['Status'] == 'READY':
+                waited = time.time() - start
+                logger.info("Provisioned concurrency of {0} ready in "
+                            "{1:.1f} s".format(alias, waited))
+                return waited
+            if response['Status'] == 'FAILED':
+                raise RuntimeError(
+                    "Provisioned concurrency of {0}:{1} failed: {2}".format(
+                        function_name, alias,
+                        response.get('StatusReason', '')))
+            if time.time() - start > PROVISIONED_READY_TIMEOUT:
+                raise RuntimeError(
+                    "Provisioned concurrency of {0}:{1} not ready after "
+                    "{2} s".format(function_name, alias,
+                                   PROVISIONED_READY_TIMEOUT))
+            time.sleep(PROVISIONED_POLL_INTERVAL)
+
+    def warm_up(self, alias):
+        """
+            Warm-up stage after moving alias, following the WarmUp config:
+            set the provisioned concurrency of the alias and wait until it
+            is ready, then send two bursts of Invocations concurrent
+            invocations (as many as provisioned by default), the first one
+            taking the cold starts left.
+
+            Return the cold and warm latencies observed (see
+            _latency_summary), also appended to warmup/<function>.jsonl in
+            the cache directory. None when there is no WarmUp config.
+        """
+        warm_up = self.config.get('WarmUp')
+        if not warm_up:
+            return None
+
+        provisioned = warm_up.get('ProvisionedConcurrency', {}).get(alias)
+        invocations = warm_up.get('Invocations', provisioned or 0)
+        if provisioned is None and not invocations:
+            return None
+
+        result = {'alias': alias, 'time': time.time()}
+        if provisioned is not None:
+            result['provisioned'] = provisioned
+            result['ready_seconds'] = self.set_provisioned_concurrency(
+                alias, provisioned)
+
+        if invocations:
+            payload = warm_up.get('Payload', '{}').encode('utf-8')
+            logger.info("Warming up {0}:{1} with {2} invocations".format(
+                self.config['FunctionName'], alias, invocations))
+            with ThreadPoolExecutor(invocations) as executor:
+                observed = []
+                for _ in range(2):
+                    observed.extend(executor.map(
+                        lambda _: self.timed_invoke(alias, payload),
+                        range(invocations)))
+            errors = [item['error'] for item in observed if item['error']]
+            if errors:
+                logger.error("{0} warm-up invocations failed: {1}".format(
+                    len(errors), errors[0]))
+            result['errors'] = len(errors)
+            result['cold'] = _latency_summary(
+                [item for item in observed if item['init_duration']])
+            result['warm'] = _latency_summary(
+                [item for item in observed if not item['init_duration']])
+            for name in ('cold', 'warm'):
+                if result[name].get('latency'):
+                    logger.info("{0}: {1} invocations, latency mean {2:.2f} "
+                                "ms, max {3:.2f} ms".format(
+                                    name, result[name]['count'],
+                                    result[name]['latency']['mean'],
+                                    result[name]['latency']['max']))
+
+        filename = path.join(_cache_directory(), 'warmup',
+                             self.config['FunctionName'] + '.jsonl')
+        if not path.isdir(path.dirname(filename)):
+            os.makedirs(path.dirname(filename))
+        with open(filename, 'a') as f:
+            f.write(json.dumps(result, sort_keys=True) + '\n')
+        return result
+
+    def invoke_async(self, qualifier, payloads, concurrency=ASYNC_CONCURRENCY,
+                     journal=None):
         """
-        raise NotImplementedError()
+            Call in async mode (Event) to the function, once per payload
+                payloads is a file or iterable with one event per line.
+
+            Up to concurrency events are in flight, less while lambda
+            throttles. The payloads that still fail after the retries are
+            appended to the journal file, which can be sent again as
+            payloads. Return the count of sent and failed events.
+        """
+        limiter = AdaptiveLimiter(concurrency)
+        journal_file = open(journal, 'ab') if journal else None
+        lock = threading.Lock()
+        # Don't read the payloads much faster than they go out
+        queued = threading.BoundedSemaphore(2 * concurrency)
+        counts = {'sent': 0, 'failed': 0}
+
+        def send(number, payload):
+            try:
+                _check_payload(payload, 'Event')
+                error = self._invoke_event(qualifier, payload, limiter)
+            except PayloadTooLarge as e:
+                error = e
+            finally:
+                queued.release()
+            with lock:
+                if error is None:
+                    counts['sent'] += 1
+                    return
+                counts['failed'] += 1
+                logger.error("Event {0} failed: {1}".format(number, error))
+                if journal_file:
+                    journal_file.write(payload + b'\n')
+                    journal_file.flush()
+
+        logger.info("Sending events to {0}:{1}".format(
+            self.config['FunctionName'], qualifier))
+        try:
+            with ThreadPoolExecutor(concurrency) as executor:
+                for number, line in enumerate(payloads, 1):
+                    if not isinstance(line, bytes):
+                        line = line.encode('utf-8')
+                    line = line.strip()
+                    if not line:
+                        continue
+                    queued.acquire()
+                    executor.submit(send, number, line)
+        finally:
+            if journal_file:
+                journal_file.close()
+
+        logger.info("{sent} events sent, {failed} failed".format(**counts))
+        return counts
 
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# This script benchmarks the deploy and invoke paths without an AWS account:
+#
+#   package_*   LambdaPackage build time (cold and cached) and zip size of
+#               synthetic source trees of growing size
+#   upload      S3FunctionUploader.upload and upload_fileobj (multipart)
+#               throughput to the local S3 stand-in (see local_aws.py)
+#   git_release _get_git_release on a synthetic repository, with and
+#               without its cache
+#   handler     cold and warm latency of the example handler in the local
+#               emulator (see lambda_emulator.py), only with --python (or
+#               --only handler): the example is python 2 code
+#
+# Every run goes to a temporary cache directory. --save writes the results
+# as the json baseline, --baseline compares with one and exits with 1 when
+# a metric regresses more than --threshold (relative).
+#
+from __future__ import print_function
+
+import argparse
+import hashlib
+import io
+import json
+import os
+from os import path
+import shutil
+import sys
+import tempfile
+import time
+
+from git import Repo
+
+import awslambda
+from awslambda import (ConfigYamlReader, LambdaPackage, PackageCache,
+                       S3FunctionUploader)
+from lambda_emulator import LocalLambda
+from local_aws import LocalS3Client
+
+EXAMPLE_CONFIG = path.join(path.dirname(path.abspath(__file__)), '..',
+                           'example.yml')
+
+MODULE_TEMPLATE = '''
+import json
+import os
+
+
+class Handler{number}:
+    """ Synthetic module {number} """
+
+    def __init__(self, name):
+        self.name = name
+        self.values = [value * {number} for value in range(100)]
+
+    def handle(self, event):
+        return json.dumps({{'name': self.name, 'event': event,
+                           'total': sum(self.values)}})
+
+
+def lambda_handler(event, context):
+    return Handler{number}(os.environ.get('NAME', 'x')).handle(event)
+'''
+
+
+def write_tree(directory, modules, per_package=50):
+    """ Synthetic source tree of modules in packages of per_package """
+    for number in range(modules):
+        package = path.join(directory, 'package{0}'.format(
+            number // per_package))
+        if not path.isdir(package):
+            os.makedirs(package)
+            open(path.join(package, '__init__.py'), 'w').close()
+        with open(path.join(package, 'module{0}.py'.format(number)),
+                  'w') as f:
+            f.write(MODULE_TEMPLATE.format(number=number))
+
+
+def best_time(function, repeat):
+    """ Lowest wall time of repeat calls of function, in seconds """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def regressions(results, baseline, threshold):
+    """ [(name, baseline value, value)] of the metrics past threshold """
+    found = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if not old or not old['value']:
+            continue
+        change = (result['value'] - old['value']) / float(old['value'])
+        if result['better'] == 'higher':
+            change = -change
+        if change > threshold:
+            found.append((name, old['value'], result['value']))
+    return found
+
+
+class Benchmark:
+    def __init__(self, options):
+        self.options = options
+        self.results = {}
+
+    def _result(self, name, value, unit, better='lower'):
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+        print("{0:<32} {1:14.4f} {2}".format(name, value, unit))
+
+    def bench_package(self, workdir):
+        for modules in self.options.modules:
+            source = path.join(workdir, 'tree{0}'.format(modules))
+            write_tree(source, modules)
+            cache_directory = path.join(workdir, 'package-cache{0}'.format(
+                modules))
+
+            def build(cache=None):
+                lp = LambdaPackage('bench', 'release', source,
+                                   target_directory=None,
+                                   cache=cache or PackageCache(
+                                       cache_directory))
+                lp.add_pyfiles()
+                lp.save()
+                return lp
+
+            def build_cold():
+                shutil.rmtree(cache_directory, True)
+                build()
+
+            self._result('package_{0}_cold'.format(modules),
+                         best_time(build_cold, self.options.repeat), 's')
+            self._result('package_{0}_cached'.format(modules),
+                         best_time(build, self.options.repeat), 's')
+            self._result('package_{0}_size'.format(modules),
+                         build().size(), 'bytes')
+
+    def bench_upload(self, workdir):
+        filename = path.join(workdir, 'upload.zip')
+        size = self.options.upload_size * 1024 * 1024
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(size))
+        s3_client = LocalS3Client(path.join(workdir, 's3'))
+        s3_client.create_bucket(Bucket='benchmark')
+        uploader = S3FunctionUploader('benchmark', s3_client=s3_client)
+        keys = iter(range(self.options.repeat))
+
+        def upload():
+            # A new key every time, or the upload is skipped
+            uploader.upload(filename, 'upload{0}.zip'.format(next(keys)))
+
+        elapsed = best_time(upload, self.options.repeat)
+        self._result('upload_throughput', size / elapsed / 1024 / 1024,
+                     'MB/s', better='higher')
+
+        with open(filename, 'rb') as f:
+            fileobj = io.BytesIO(f.read())
+        sha256 = hashlib.sha256(fileobj.getvalue()).hexdigest()
+
+        def upload_multipart():
+            uploader.upload_fileobj(
+                fileobj, 'multipart{0}.zip'.format(next(keys)), sha256,
+                part_size=awslambda.UPLOAD_PART_SIZE)
+
+        keys = iter(range(self.options.repeat))
+        elapsed = best_time(upload_multipart, self.options.repeat)
+        self._result('upload_multipart_throughput',
+                     size / elapsed / 1024 / 1024, 'MB/s', better='higher')
+
+    def bench_git_release(self, workdir):
+        directory = path.join(workdir, 'repository')
+        write_tree(path.join(directory, 'code'), self.options.git_files)
+        repo = Repo.init(directory)
+        repo.git.update_environment(GIT_COMMITTER_NAME='Benchmark',
+                                    GIT_COMMITTER_EMAIL='benchmark@localhost')
+        repo.git.add('--all')
+        repo.git.commit('-m', 'synthetic', '--no-gpg-sign',
+                        author='Benchmark <benchmark@localhost>')
+        code = path.join(directory, 'code')
+        releases = path.join(os.environ['LAMBDA_PACKAGE_CACHE'], 'releases')
+
+        def uncached():
+            shutil.rmtree(releases, True)
+            awslambda._get_git_release(code)
+
+        self._result('git_release_uncached',
+                     best_time(uncached, self.options.repeat), 's')
+        self._result('git_release_cached',
+                     best_time(lambda: awslambda._get_git_release(code),
+                               self.options.repeat), 's')
+
+    def bench_handler(self, workdir):
+        config = ConfigYamlReader(self.options.config).config
+        config['Code']['Directory'] = path.join(
+            path.dirname(path.abspath(self.options.config)),
+            config['Code']['Directory'])
+        # What the example handler needs, with the local S3
+        variables = config.setdefault('Environment', {}).setdefault(
+            'Variables', {})
+        variables.setdefault('S3_BUCKET', 'benchmark')
+        variables.setdefault('S3_FILENAME', 'example/lasttimestamp')
+        s3_directory = path.join(workdir, 'handler-s3')
+
+        cold = []
+        for _ in range(self.options.repeat):
+            local_lambda = LocalLambda(config, python=self.options.python,
+                                       s3_directory=s3_directory)
+            try:
+                invocation = local_lambda.invoke({})
+            finally:
+                local_lambda.close()
+            if invocation.error:
+                raise RuntimeError(invocation.error)
+            cold.append(invocation.init_duration + invocation.duration)
+
+        local_lambda = LocalLambda(config, python=self.options.python,
+                                   s3_directory=s3_directory)
+        try:
+            local_lambda.invoke({})
+            warm = sorted(local_lambda.invoke({}).duration
+                          for _ in range(self.options.invocations))
+        finally:
+            local_lambda.close()
+
+        self._result('handler_cold', min(cold), 'ms')
+        self._result('handler_warm_p50', warm[len(warm) // 2], 'ms')
+
+    def _save(self):
+        with open(self.options.save, 'w') as f:
+            json.dump(self.results, f, indent=2, sort_keys=True)
+
+    def __call__(self):
+        workdir = tempfile.mkdtemp(prefix='awslambda-benchmark-')
+        previous_cache = os.environ.get('LAMBDA_PACKAGE_CACHE')
+        os.environ['LAMBDA_PACKAGE_CACHE'] = path.join(workdir, 'cache')
+        try:
+            for name in self.options.only:
+                getattr(self, 'bench_' + name)(workdir)
+        except Exception:
+            # Keep what was measured before the failure
+            if self.options.save and self.results:
+                self._save()
+                print("Results so far saved to {0}".format(
+                    self.options.save))
+            raise
+        finally:
+            if previous_cache is None:
+                del os.environ['LAMBDA_PACKAGE_CACHE']
+            else:
+                os.environ['LAMBDA_PACKAGE_CACHE'] = previous_cache
+            shutil.rmtree(workdir, True)
+
+        if self.options.save:
+            self._save()
+        if self.options.baseline:
+            with open(self.options.baseline) as f:
+                baseline = json.load(f)
+            found = regressions(self.results, baseline,
+                                self.options.threshold)
+            for name, old, new in found:
+                print("REGRESSION {0}: {1:.4f} -> {2:.4f}".format(
+                    name, old, new))
+            if found:
+                sys.exit(1)
+            print("No regression past {0:.0%}".format(self.options.threshold))
+        return self.results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark operation')
+    parser.add_argument('--only', nargs='+',
+                        choices=['package', 'upload', 'git_release',
+                                 'handler'],
+                        help='all of them by default, handler only with '
+                             '--python')
+    parser.add_argument('--baseline', help='json results to compare with')
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative regression that fails the run')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per measure, the best one counts')
+    parser.add_argument('--modules', type=int, nargs='+',
+                        default=[100, 1000],
+                        help='modules of the synthetic source trees')
+    parser.add_argument('--upload-size', type=int, default=32,
+                        help='MB uploaded')
+    parser.add_argument('--git-files', type=int, default=5000,
+                        help='files of the synthetic repository')
+    parser.add_argument('--invocations', type=int, default=50,
+                        help='warm invocations of the handler')
+    parser.add_argument('--config', default=EXAMPLE_CONFIG,
+                        help='function config of the handler benchmark')
+    parser.add_argument('--python',
+                        help='interpreter matching the function Runtime, '
+                             'the current one by default')
+    args = parser.parse_args()
+    if args.only is None:
+        args.only = ['package', 'upload', 'git_release']
+        if args.python:
+            args.only.append('handler')
+    args.python = args.python or sys.executable
+
+    Benchmark(args)()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# This script measures the cost per record of the function in the local
+# emulator: one invocation per record against batches of records (SQS
+# like events), after a warm-up invocation so only warm containers count.
+#
+# Use --s3-directory to run the example function without S3.
+#
+from __future__ import print_function
+
+import argparse
+import sys
+
+from awslambda import ConfigYamlReader
+from lambda_emulator import LocalLambda
+
+
+class CompareBatch:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+
+    @staticmethod
+    def _batch_event(size):
+        return {'Records': [{'messageId': str(number), 'body': '{}'}
+                            for number in range(size)]}
+
+    def _measure(self, local_lambda, event, records):
+        """ Mean warm duration per record, in ms """
+        total = 0.0
+        for _ in range(self.options.repeat):
+            invocation = local_lambda.invoke(event)
+            if invocation.error:
+                print(invocation.error)
+                sys.exit(1)
+            total += invocation.duration
+        return total / self.options.repeat / records
+
+    def __call__(self):
+        local_lambda = LocalLambda(self.config.config,
+                                   python=self.options.python,
+                                   s3_directory=self.options.s3_directory)
+        try:
+            local_lambda.invoke({})
+            results = [('single', 1, self._measure(local_lambda, {}, 1))]
+            for size in self.options.batch_size:
+                results.append(('batch', size, self._measure(
+                    local_lambda, self._batch_event(size), size)))
+        finally:
+            local_lambda.close()
+
+        single = results[0][2]
+        print("{0:<8} {1:>8} {2:>16} {3:>10}".format(
+            'mode', 'records', 'ms per record', 'speedup'))
+        for mode, size, per_record in results:
+            print("{0:<8} {1:>8} {2:16.3f} {3:9.1f}x".format(
+                mode, size, per_record, single / per_record))
+        return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Batch cost comparison')
+    parser.add_argument('configfile')
+    parser.add_argument('--batch-size', type=int, nargs='+',
+                        default=[10, 100])
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='invocations measured per mode')
+    parser.add_argument('--s3-directory',
+                        help='directory to use as local S3')
+    parser.add_argument('--python', default=sys.executable,
+                        help='interpreter matching the function Runtime')
+    args = parser.parse_args()
+
+    CompareBatch(args.configfile, args)()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# This script releases many functions sharing a codebase: the configs with
+# the same Code.Directory and packaging options share one package, built
+# and uploaded once, and then every function gets its new version and
+# aliases concurrently.
+#
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+import sys
+import time
+
+from awslambda import AwsLambdaManager, ConfigYamlReader
+
+
+def _package_key(config):
+    """ Configs with the same key can share the same package """
+    code = config['Code']
+    return (
+        path.abspath(code['Directory']),
+        code['S3Bucket'],
+        code['S3KeyPath'],
+        config['Runtime'],
+        config['Handler'] if code.get('Slim') else None,
+        tuple(code.get('KeepModules', ())),
+        code.get('Optimize', 0),
+        code.get('CompressLevel'),
+    )
+
+
+class CreateFleetRelease:
+    def __init__(self, configfiles, alias, workers):
+        self.alias = alias
+        self.workers = workers
+        self.aws_lambdas = [
+            AwsLambdaManager(ConfigYamlReader(configfile).config)
+            for configfile in configfiles
+        ]
+
+    def _release(self, aws_lambda, code):
+        start = time.time()
+        try:
+            version = aws_lambda.release_package(self.alias, code)
+            error = None
+        except Exception as e:
+            version = None
+            error = e
+        return (aws_lambda.config['FunctionName'], version, error,
+                time.time() - start)
+
+    def _release_group(self, aws_lambdas):
+        lead = aws_lambdas[0]
+        directory = lead.config['Code']['Directory']
+
+        start = time.time()
+        lead.create_package(directory,
+                            path.basename(path.normpath(directory)))
+        code = lead.package_code()
+        print("Package {0} ready in {1:.2f} s for {2} functions".format(
+            lead.local_filename, time.time() - start, len(aws_lambdas)))
+
+        for aws_lambda in aws_lambdas[1:]:
+            aws_lambda.set_package(lead.package, lead.hash_release)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(
+                lambda aws_lambda: self._release(aws_lambda, code),
+                aws_lambdas))
+
+    def __call__(self):
+        groups = OrderedDict()
+        for aws_lambda in self.aws_lambdas:
+            groups.setdefault(_package_key(aws_lambda.config),
+                              []).append(aws_lambda)
+
+        start = time.time()
+        results = []
+        for aws_lambdas in groups.values():
+            results.extend(self._release_group(aws_lambdas))
+
+        print("")
+        print("{0:<40} {1:>10} {2:>10}".format('function', 'version',
+                                               'seconds'))
+        for function_name, version, error, elapsed in results:
+            print("{0:<40} {1:>10} {2:10.2f}{3}".format(
+                function_name, version or '-', elapsed,
+                '  {0}'.format(error) if error else ''))
+        print("{0} functions in {1:.2f} s".format(len(results),
+                                                 time.time() - start))
+
+        if any(error for _, _, error, _ in results):
+            sys.exit(1)
+        return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Create fleet release')
+    parser.add_argument('configfiles', nargs='+')
+    parser.add_argument('--alias', default='devel')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='functions released at the same time')
+    args = parser.parse_args()
+
+    CreateFleetRelease(args.configfiles, args.alias, args.workers)()
@@ -8,14 +8,18 @@ from awslambda import AwsLambdaManager, ConfigYamlReader
 
 
 class CreateFunctionRelease:
-    def __init__(self, configfile, alias):
+    def __init__(self, configfile, alias, warm_up=False):
         self.config = ConfigYamlReader(configfile)
         self.alias = alias
+        self.warm_up = warm_up
         self.aws_lambda = AwsLambdaManager(self.config.config)
 
     def __call__(self):
         if self.aws_lambda.function_exists():
-            return(self.aws_lambda.create_release(self.alias))
+            version = self.aws_lambda.create_release(self.alias)
+            if self.warm_up:
+                self.aws_lambda.warm_up(self.alias)
+            return version
         else:
             print("Lambda function not found")
             sys.exit(1)
@@ -26,6 +30,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Create release operation')
     parser.add_argument('configfile')
     parser.add_argument('--alias', default='devel')
+    parser.add_argument('--warm-up', action='store_true',
+                        help='warm the alias up (see WarmUp in the config)')
     args = parser.parse_args()
 
-    CreateFunctionRelease(args.configfile, args.alias)()
+    CreateFunctionRelease(args.configfile, args.alias, args.warm_up)()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# This script loads a lambda handler from its package zip, like the runtime
+# does, and measures the cold start: the import time and memory of every
+# module, the handler initialization and the first invocation. The measures
+# are written as json into a file.
+#
+# It only uses the standard library, so nothing is imported before the
+# handler does it. Use profile_imports.py to run it over a function config.
+#
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class LambdaContext:
+    """ The bits of the lambda context object a handler usually reads """
+
+    def __init__(self, function_name, memory_limit_in_mb=128, timeout=3):
+        self.function_name = function_name
+        self.function_version = '$LATEST'
+        self.memory_limit_in_mb = memory_limit_in_mb
+        self.aws_request_id = 'import-profiler'
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+
+class ImportRecorder:
+    """
+        Replace __import__ to record, for every import loading new modules,
+        the import stack, the cumulative and self time and the memory
+        allocated.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.records = []
+        self.phase = 'init'
+        self.original_import = builtins.__import__
+
+    def __enter__(self):
+        if tracemalloc:
+            tracemalloc.start()
+        builtins.__import__ = self
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self.original_import
+        if tracemalloc:
+            tracemalloc.stop()
+
+    @staticmethod
+    def _memory():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc else 0
+
+    @staticmethod
+    def _absolute_name(name, globals, level):
+        if not level or not globals:
+            return name
+        package = globals.get('__package__') or globals.get('__name__', '')
+        if not globals.get('__path__') and not globals.get('__package__'):
+            package = package.rpartition('.')[0]
+        for _ in range(level - 1):
+            package = package.rpartition('.')[0]
+        return '.'.join(part for part in (package, name) if part)
+
+    def __call__(self, name, globals=None, locals=None, fromlist=(),
+                 level=0):
+        modules_before = len(sys.modules)
+        frame = {
+            'name': self._absolute_name(name, globals, level),
+            'children': 0.0,
+        }
+        self.stack.append(frame)
+        memory = self._memory()
+        start = clock()
+        try:
+            return self.original_import(name, globals, locals, fromlist,
+                                        level)
+        finally:
+            elapsed = clock() - start
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]['children'] += elapsed
+            if len(sys.modules) != modules_before:
+                self.records.append({
+                    'name': frame['name'],
+                    'stack': [item['name'] for item in self.stack] +
+                             [frame['name']],
+                    'phase': self.phase,
+                    'cumulative': elapsed,
+                    'self': elapsed - frame['children'],
+                    'memory': self._memory() - memory,
+                })
+
+
+def profile(zip_filename, handler, event, function_name='profile'):
+    # The package replaces the script directory, like in the runtime
+    sys.path[0] = zip_filename
+    module_name, function = handler.rsplit('.', 1)
+    result = {'error': None}
+
+    with ImportRecorder() as recorder:
+        start = clock()
+        __import__(module_name)
+        handler_function = getattr(sys.modules[module_name], function)
+        result['init'] = clock() - start
+
+        recorder.phase = 'invocation'
+        start = clock()
+        try:
+            handler_function(event, LambdaContext(function_name))
+        except BaseException as e:
+            result['error'] = repr(e)
+        result['invocation'] = clock() - start
+
+    result['modules'] = recorder.records
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print("Usage: {0} <package.zip> <handler> <payload.json|-> "
+              "<output.json>".format(sys.argv[0]))
+        sys.exit(1)
+
+    zip_filename, handler, payload, output = sys.argv[1:]
+    event = {}
+    if payload != '-':
+        with open(payload) as f:
+            event = json.load(f)
+
+    result = profile(zip_filename, handler, event)
+    with open(output, 'w') as f:
+        json.dump(result, f)
@@ -4,7 +4,7 @@ from pprint import pprint
 import sys
 import argparse
 
-from awslambda import AwsLambdaManager, ConfigYamlReader
+from awslambda import AwsLambdaManager, ConfigYamlReader, ASYNC_CONCURRENCY
 
 
 class LambdaInvokeFunction:
@@ -23,26 +23,45 @@ class LambdaInvokeFunction:
                     if self.options.version
                     else self.options.alias)
 
+        if self.options.invoke_async:
+            return self.aws_lambda.invoke_async(
+                str(qualifier),
+                self.options.payload or [b'{}'],
+                concurrency=self.options.concurrency,
+                journal=self.options.journal)
 
-        func = (self.aws_lambda_invoke_async
-                if self.options.async
-                else self.aws_lambda.invoke_sync)
+        if self.options.batch:
+            return self.aws_lambda.invoke_batch(
+                str(qualifier),
+                self.options.payload or [b'{}'],
+                output=self.options.output,
+                concurrency=self.options.concurrency)
 
-        return func(str(qualifier), self.options.payload)
+        return self.aws_lambda.invoke_sync(str(qualifier),
+                                           self.options.payload,
+                                           output=self.options.output)
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Create release operation')
     parser.add_argument('configfile')
-    parser.add_argument('--payload', type=argparse.FileType('r'))
+    parser.add_argument('--payload', type=argparse.FileType('rb'))
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--alias', default='$LATEST')
     group.add_argument('--version', type=int)
 
-    parser.add_argument('--async', type=bool, default=False)
+    # In async and batch modes the payload file has one event per line
+    parser.add_argument('--async', dest='invoke_async', action='store_true')
+    parser.add_argument('--batch', action='store_true',
+                        help='sync call per payload line')
+    parser.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY,
+                        help='events in flight in async and batch modes')
+    parser.add_argument('--output', type=argparse.FileType('wb'),
+                        help='file to write the response payloads to')
+    parser.add_argument('--journal',
+                        help='file to append the failed async events to')
     args = parser.parse_args()
 
     pprint(LambdaInvokeFunction(args.configfile, args)())
-
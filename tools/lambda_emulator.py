@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# Local lambda execution engine: runs a function Handler in a pool of
+# container processes that are kept warm and reused between invocations,
+# enforcing its Timeout and MemorySize and giving the same REPORT lines
+# as the real service.
+#
+# The containers are fresh interpreters running this file with --worker,
+# so the handler init (imports included) is as cold as in lambda. Only the
+# standard library is imported here for the same reason.
+#
+from __future__ import print_function
+
+import json
+import math
+import os
+from os import path
+import select
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Lambda defaults when the config doesn't set them
+DEFAULT_TIMEOUT = 3
+DEFAULT_MEMORY_SIZE = 128
+
+KILLED_ERROR = 'Runtime exited with error: signal: killed'
+
+
+class Invocation:
+    """ Result of a local invocation """
+
+    def __init__(self, request_id, result=None, error=None, duration=0.0,
+                 init_duration=None, max_memory_used=0, memory_size=0):
+        self.request_id = request_id
+        self.result = result
+        self.error = error
+        self.duration = duration
+        self.init_duration = init_duration
+        self.max_memory_used = max_memory_used
+        self.memory_size = memory_size
+
+    @property
+    def cold(self):
+        return self.init_duration is not None
+
+    @property
+    def billed_duration(self):
+        return int(math.ceil(self.duration))
+
+    def report(self):
+        """ The REPORT line lambda writes at the end of an invocation """
+        line = ("REPORT RequestId: {0}\tDuration: {1:.2f} ms\t"
+                "Billed Duration: {2} ms\tMemory Size: {3} MB\t"
+                "Max Memory Used: {4} MB").format(
+                    self.request_id, self.duration, self.billed_duration,
+                    self.memory_size, self.max_memory_used)
+        if self.cold:
+            line += "\tInit Duration: {0:.2f} ms".format(self.init_duration)
+        return line + "\t"
+
+
+class LocalContainer:
+    """ One container process, initialized once and invoked many times """
+
+    def __init__(self, config, python=sys.executable, s3_directory=None):
+        self.config = config
+        self.timeout = config.get('Timeout') or DEFAULT_TIMEOUT
+        self.memory_size = config.get('MemorySize') or DEFAULT_MEMORY_SIZE
+        self.init_duration = None
+        self.init_error = None
+        self.timed_out = False
+
+        env = dict(os.environ)
+        env.update(config.get('Environment', {}).get('Variables', {}))
+        env.update({
+            'AWS_LAMBDA_FUNCTION_NAME': config['FunctionName'],
+            'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': str(self.memory_size),
+            'AWS_LAMBDA_FUNCTION_VERSION': '$LATEST',
+        })
+        worker_config = {
+            'FunctionName': config['FunctionName'],
+            'Handler': config['Handler'],
+            'Directory': path.abspath(config['Code']['Directory']),
+            'MemorySize': self.memory_size,
+            'Timeout': self.timeout,
+            'S3Directory': s3_directory and path.abspath(s3_directory),
+        }
+        self.process = subprocess.Popen(
+            [python, path.abspath(__file__), '--worker',
+             json.dumps(worker_config)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env)
+
+        message = self._receive(self.timeout)
+        if message is None:
+            self.init_error = KILLED_ERROR
+        else:
+            self.init_duration = message['duration']
+            self.init_error = message['error']
+
+    def _receive(self, timeout):
+        """
+            Next message of the worker, None if it died or timed out (then
+            timed_out is set)
+        """
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        self.timed_out = not ready
+        if not ready:
+            return None
+        line = self.process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line.decode('utf-8'))
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def invoke(self, event):
+        request_id = str(uuid.uuid4())
+        init_duration = self.init_duration
+        # Only the first invocation of a container reports the init
+        self.init_duration = None
+
+        invocation = Invocation(request_id, init_duration=init_duration,
+                                memory_size=self.memory_size)
+        if self.init_error:
+            invocation.error = self.init_error
+            self.close()
+            return invocation
+
+        start = clock()
+        self.process.stdin.write((json.dumps({
+            'request_id': request_id,
+            'event': event,
+        }) + '\n').encode('utf-8'))
+        self.process.stdin.flush()
+        message = self._receive(self.timeout)
+        invocation.duration = (clock() - start) * 1000
+
+        if message is None:
+            if self.timed_out:
+                invocation.error = 'Task timed out after {0:.2f} seconds'.format(
+                    self.timeout)
+                invocation.duration = self.timeout * 1000.0
+            else:
+                invocation.error = KILLED_ERROR
+                invocation.max_memory_used = self.memory_size
+            self.close()
+            return invocation
+
+        invocation.result = message['result']
+        invocation.error = message['error']
+        invocation.max_memory_used = message['max_memory_used']
+        return invocation
+
+    def close(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+
+class LocalLambda:
+    """
+        Pool of up to concurrency warm containers of the function in config
+        (same format as AwsLambdaManager). An idle container is reused for
+        the next invocation, like lambda does; a new one (cold start) is only
+        started when all of them are busy.
+    """
+
+    def __init__(self, config, concurrency=1, python=sys.executable,
+                 s3_directory=None):
+        self.config = config
+        self.concurrency = concurrency
+        self.python = python
+        self.s3_directory = s3_directory
+        self.idle = []
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def _acquire(self):
+        with self.condition:
+            while not self.idle and self.running >= self.concurrency:
+                self.condition.wait()
+            self.running += 1
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return LocalContainer(self.config, self.python, self.s3_directory)
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, container):
+        with self.condition:
+            self.running -= 1
+            if container is not None and container.alive:
+                self.idle.append(container)
+            self.condition.notify()
+
+    def invoke(self, event):
+        container = self._acquire()
+        try:
+            return container.invoke(event)
+        finally:
+            self._release(container)
+
+    def close(self):
+        with self.condition:
+            for container in self.idle:
+                container.close()
+            self.idle = []
+
+
+def _rss_bytes():
+    """ Resident memory of this process, None where /proc isn't there """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _max_memory_used():
+    """ Max resident memory of this process, in MB """
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives KiB, macOS bytes
+    if sys.platform == 'darwin':
+        maxrss //= 1024
+    return int(math.ceil(maxrss / 1024.0))
+
+
+def _watch_memory(limit):
+    """ Kill the container when it goes over its memory, like lambda """
+    while True:
+        rss = _rss_bytes()
+        if rss is None:
+            return
+        if rss > limit:
+            os._exit(137)
+        time.sleep(0.01)
+
+
+def _install_local_s3(directory):
+    """
+        Make boto3.client('s3') return the local S3 stand-in. boto3 gets
+        imported here, so it isn't part of the Init Duration anymore.
+    """
+    from local_aws import LocalS3Client
+    try:
+        import boto3
+    except ImportError:
+        return
+    client = boto3.client
+
+    def local_client(service_name, *args, **kwargs):
+        if service_name == 's3':
+            return LocalS3Client(directory)
+        return client(service_name, *args, **kwargs)
+    boto3.client = local_client
+
+
+def worker(config):
+    from import_profiler import LambdaContext
+
+    # The protocol goes through our own copy of stdout, what the handler
+    # prints goes to stderr (the container log)
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    def send(message):
+        protocol.write(json.dumps(message) + '\n')
+        protocol.flush()
+
+    watcher = threading.Thread(target=_watch_memory,
+                               args=(config['MemorySize'] * 1024 * 1024,))
+    watcher.daemon = True
+    watcher.start()
+
+    if config['S3Directory']:
+        _install_local_s3(config['S3Directory'])
+
+    sys.path[0] = config['Directory']
+    module_name, function_name = config['Handler'].rsplit('.', 1)
+    start = clock()
+    error = None
+    try:
+        __import__(module_name)
+        handler = getattr(sys.modules[module_name], function_name)
+    except BaseException as e:
+        error = repr(e)
+    send({'duration': (clock() - start) * 1000, 'error': error})
+    if error:
+        return
+
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        context = LambdaContext(config['FunctionName'], config['MemorySize'],
+                                config['Timeout'])
+        context.aws_request_id = request['request_id']
+        result = error = None
+        try:
+            result = handler(request['event'], context)
+        except BaseException as e:
+            error = repr(e)
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            result = repr(result)
+        send({'result': result, 'error': error,
+              'max_memory_used': _max_memory_used()})
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ['--worker'] or len(sys.argv) != 3:
+        print("Internal use, see local_invoke.py")
+        sys.exit(1)
+    worker(json.loads(sys.argv[2]))
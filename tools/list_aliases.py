@@ -18,7 +18,12 @@ class ListAliases:
 
         aliases = self.aws_lambda.list_aliases()
         for item in aliases['Aliases']:
-            print("{Name} -> {FunctionVersion}".format(**item))
+            weights = (item.get('RoutingConfig') or {}).get(
+                'AdditionalVersionWeights') or {}
+            print("{0} -> {1}{2}".format(
+                item['Name'], item['FunctionVersion'], "".join(
+                    " (+ {0}: {1:.0%})".format(version, weight)
+                    for version, weight in sorted(weights.items()))))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+# Load generation over a lambda function: replays a corpus of payloads with
+# a fixed concurrency (closed loop) or a fixed request rate (open loop) and
+# records the latencies in HDR style histograms.
+#
+# The target is any callable taking a payload (the bytes of one corpus
+# line) and raising on failure, see replay_load.py for the aws and local
+# ones.
+#
+import itertools
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class LatencyHistogram:
+    """
+        Log-linear histogram of integer values (microseconds): exact up to
+        2 * SUB_BUCKETS, then SUB_BUCKETS buckets per power of two, so any
+        value is recorded with less than 1% relative error in constant
+        memory, whatever the range.
+    """
+
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return shift * cls.SUB_BUCKETS + (value >> shift)
+
+    @classmethod
+    def _highest_value(cls, index):
+        """ Highest value recorded in the bucket index """
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        mantissa = index - shift * cls.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self._index(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        with self.lock:
+            for index, count in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + count
+            self.count += other.count
+            self.total += other.total
+            if other.count:
+                self.min = (other.min if self.min is None
+                            else min(self.min, other.min))
+                self.max = (other.max if self.max is None
+                            else max(self.max, other.max))
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'min': self.min or 0,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max or 0,
+        }
+
+    def to_dict(self):
+        return {
+            'unit': 'us',
+            'sub_bucket_bits': self.SUB_BUCKET_BITS,
+            'counts': dict((str(index), count)
+                           for index, count in self.counts.items()),
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = dict((int(index), count)
+                                for index, count in data['counts'].items())
+        histogram.count = sum(histogram.counts.values())
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+def read_corpus(filename, repeat=False):
+    """ Yield the payloads of a JSONL file, one line each, lazily """
+    while True:
+        with open(filename, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        if not repeat:
+            return
+
+
+class LoadGenerator:
+    """
+        Send the payloads to target with up to concurrency requests in
+        flight. With rate, requests are started at that rate per second
+        whatever the latency of the previous ones, and their latency counts
+        from the moment they were due, so a slow target can't hide its queue
+        (no coordinated omission).
+    """
+
+    def __init__(self, target, concurrency=1, rate=None, duration=None):
+        self.target = target
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.requests = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def _send(self, payload, due=None):
+        start = clock()
+        try:
+            self.target(payload)
+            failed = False
+        except Exception:
+            failed = True
+        self.latency.record((clock() - (due or start)) * 1000000)
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+
+    def _run_closed_loop(self, payloads, deadline):
+        payloads_lock = threading.Lock()
+
+        def worker():
+            while deadline is None or clock() < deadline:
+                with payloads_lock:
+                    payload = next(payloads, None)
+                if payload is None:
+                    return
+                self._send(payload)
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _run_open_loop(self, payloads, deadline, start):
+        interval = 1.0 / self.rate
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for number, payload in enumerate(payloads):
+                due = start + number * interval
+                if deadline is not None and due >= deadline:
+                    break
+                delay = due - clock()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._send, payload, due)
+
+    def run(self, payloads):
+        payloads = iter(payloads)
+        start = clock()
+        deadline = start + self.duration if self.duration else None
+        if self.rate:
+            self._run_open_loop(payloads, deadline, start)
+        else:
+            self._run_closed_loop(payloads, deadline)
+        self.elapsed = clock() - start
+        return self.result()
+
+    def result(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'elapsed': self.elapsed,
+            'throughput': self.requests / self.elapsed if self.elapsed else 0,
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'latency': self.latency.summary(),
+            'histogram': self.latency.to_dict(),
+        }
+
+
+def compare(result, baseline):
+    """ Return [(metric, baseline value, value, relative change)] """
+    rows = [('throughput', baseline['throughput'], result['throughput'])]
+    for metric in ('p50', 'p90', 'p99', 'max'):
+        rows.append((metric, baseline['latency'][metric],
+                     result['latency'][metric]))
+    rows.append(('error rate',
+                 float(baseline['errors']) / max(1, baseline['requests']),
+                 float(result['errors']) / max(1, result['requests'])))
+    return [(name, old, new, (new - old) / float(old) if old else 0.0)
+            for name, old, new in rows]
+
+
+def save_result(result, filename):
+    with open(filename, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+
+def load_result(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def limit(payloads, count):
+    return itertools.islice(payloads, count) if count else payloads
@@ -0,0 +1,590 @@
+# Local stand-ins for the AWS clients, to run the functions and the tools
+# without an AWS account. They implement the subset of the boto3 client
+# methods this repo calls, with the same arguments and responses.
+#
+# Only the standard library is used, so they can be loaded inside the
+# emulated lambda containers without changing what the handler imports.
+#
+import base64
+import calendar
+import copy
+import hashlib
+import io
+import json
+import os
+from os import path
+import random
+import shutil
+import threading
+import time
+import uuid
+
+
+class ClientError(Exception):
+    """ Mimics botocore.exceptions.ClientError """
+
+    def __init__(self, code, operation_name, message=''):
+        self.response = {'Error': {'Code': code, 'Message': message}}
+        self.operation_name = operation_name
+        super(ClientError, self).__init__(
+            'An error occurred ({0}) when calling the {1} operation: '
+            '{2}'.format(code, operation_name, message))
+
+
+class LocalMeta:
+    """ The client meta of boto3, with the account of the local ARNs """
+
+    def __init__(self, region_name='local', account_id='0'):
+        self.region_name = region_name
+        self.account_id = account_id
+
+
+class LocalPaginator:
+    """ get_paginator of boto3, for operations answered in one page """
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class LocalS3Client:
+    """
+        S3 client storing buckets as directories under directory, and the
+        object metadata in a json file beside every object. Multipart
+        uploads keep their parts in uploads/<UploadId> of the bucket until
+        they are completed, so they can be resumed by another client.
+    """
+
+    class exceptions:
+        ClientError = ClientError
+        NoSuchBucket = ClientError
+        NoSuchKey = ClientError
+        NoSuchUpload = type('NoSuchUpload', (ClientError,), {})
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not path.isdir(directory):
+            os.makedirs(directory)
+
+    def _bucket_path(self, bucket, operation_name):
+        bucket_path = path.join(self.directory, bucket)
+        if not path.isdir(bucket_path):
+            raise ClientError('NoSuchBucket', operation_name, bucket)
+        return bucket_path
+
+    def _object_paths(self, bucket, key, operation_name):
+        bucket_path = self._bucket_path(bucket, operation_name)
+        object_path = path.join(bucket_path, 'objects', key)
+        meta_path = path.join(bucket_path, 'metadata', key + '.json')
+        return object_path, meta_path
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name}
+                            for name in sorted(os.listdir(self.directory))]}
+
+    def create_bucket(self, Bucket, **kwargs):
+        bucket_path = path.join(self.directory, Bucket)
+        if not path.isdir(bucket_path):
+            os.makedirs(path.join(bucket_path, 'objects'))
+            os.makedirs(path.join(bucket_path, 'metadata'))
+        return {'Location': '/' + Bucket}
+
+    def head_bucket(self, Bucket):
+        self._bucket_path(Bucket, 'HeadBucket')
+        return {}
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, **kwargs):
+        object_path, meta_path = self._object_paths(Bucket, Key, 'PutObject')
+        for filename in (object_path, meta_path):
+            if not path.isdir(path.dirname(filename)):
+                os.makedirs(path.dirname(filename))
+        with open(object_path, 'wb') as f:
+            if hasattr(Body, 'read'):
+                shutil.copyfileobj(Body, f)
+            else:
+                f.write(Body)
+        with open(meta_path, 'w') as f:
+            json.dump(Metadata or {}, f)
+        return {}
+
+    def head_object(self, Bucket, Key):
+        object_path, meta_path = self._object_paths(Bucket, Key, 'HeadObject')
+        if not path.isfile(object_path):
+            raise ClientError('404', 'HeadObject', 'Not Found')
+        with open(meta_path) as f:
+            metadata = json.load(f)
+        return {'ContentLength': path.getsize(object_path),
+                'Metadata': metadata}
+
+    def get_object(self, Bucket, Key):
+        response = self.head_object(Bucket, Key)
+        object_path, _ = self._object_paths(Bucket, Key, 'GetObject')
+        response['Body'] = open(object_path, 'rb')
+        return response
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f,
+                            **(ExtraArgs or {}))
+
+    def get_paginator(self, operation_name):
+        return LocalPaginator(getattr(self, operation_name))
+
+    def _upload_path(self, bucket, key, upload_id, operation_name):
+        upload_path = path.join(self._bucket_path(bucket, operation_name),
+                                'uploads', upload_id)
+        try:
+            with open(path.join(upload_path, 'upload.json')) as f:
+                upload = json.load(f)
+        except (IOError, OSError, ValueError):
+            upload = None
+        if not upload or upload['Key'] != key:
+            raise self.exceptions.NoSuchUpload(
+                'NoSuchUpload', operation_name,
+                'The specified upload does not exist')
+        return upload_path, upload
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        upload_path = path.join(
+            self._bucket_path(Bucket, 'CreateMultipartUpload'), 'uploads',
+            upload_id)
+        os.makedirs(upload_path)
+        with open(path.join(upload_path, 'upload.json'), 'w') as f:
+            json.dump({'Key': Key, 'Metadata': Metadata or {}}, f)
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        upload_path, _ = self._upload_path(Bucket, Key, UploadId,
+                                           'UploadPart')
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        part_path = path.join(upload_path, str(PartNumber))
+        with open(part_path + '.tmp', 'wb') as f:
+            f.write(Body)
+        os.rename(part_path + '.tmp', part_path)
+        return {'ETag': '"{0}"'.format(hashlib.md5(Body).hexdigest())}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        upload_path, _ = self._upload_path(Bucket, Key, UploadId,
+                                           'ListParts')
+        parts = []
+        for name in os.listdir(upload_path):
+            if not name.isdigit():
+                continue
+            with open(path.join(upload_path, name), 'rb') as f:
+                data = f.read()
+            parts.append({
+                'PartNumber': int(name),
+                'ETag': '"{0}"'.format(hashlib.md5(data).hexdigest()),
+                'Size': len(data),
+            })
+        return {'Parts': sorted(parts, key=lambda part: part['PartNumber'])}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload):
+        upload_path, upload = self._upload_path(
+            Bucket, Key, UploadId, 'CompleteMultipartUpload')
+        etags = dict((part['PartNumber'], part['ETag'])
+                     for part in self.list_parts(Bucket, Key,
+                                                 UploadId)['Parts'])
+        body = io.BytesIO()
+        for part in MultipartUpload['Parts']:
+            if etags.get(part['PartNumber']) != part['ETag']:
+                raise ClientError('InvalidPart', 'CompleteMultipartUpload',
+                                  'Part {0} not found or ETag mismatch'
+                                  .format(part['PartNumber']))
+            with open(path.join(upload_path, str(part['PartNumber'])),
+                      'rb') as f:
+                body.write(f.read())
+        body.seek(0)
+        self.put_object(Bucket=Bucket, Key=Key, Body=body,
+                        Metadata=upload['Metadata'])
+        shutil.rmtree(upload_path, True)
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        upload_path, _ = self._upload_path(Bucket, Key, UploadId,
+                                           'AbortMultipartUpload')
+        shutil.rmtree(upload_path, True)
+        return {}
+
+
+class LocalLambdaContext:
+    """ The context object given to the handlers of LocalLambdaClient """
+
+    def __init__(self, configuration, deadline):
+        self.function_name = configuration['FunctionName']
+        self.function_version = configuration['Version']
+        self.memory_limit_in_mb = configuration['MemorySize']
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = deadline
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.time()) * 1000))
+
+
+class LocalLambdaClient:
+    """
+        Lambda client keeping the functions, their versions and aliases in
+        memory, with the weighted routing of aliases (RoutingConfig), and
+        the layer versions published (their content is not kept).
+
+        The code of a function is a python callable handler(event, context)
+        set with set_handler (not a boto3 method), publish_version freezes
+        it in the version. Every invocation is recorded for
+        LocalCloudWatchClient.
+    """
+
+    class exceptions:
+        ClientError = ClientError
+        ResourceNotFoundException = type(
+            'ResourceNotFoundException', (ClientError,), {})
+        InvalidParameterValueException = type(
+            'InvalidParameterValueException', (ClientError,), {})
+        ResourceConflictException = type(
+            'ResourceConflictException', (ClientError,), {})
+        TooManyRequestsException = type(
+            'TooManyRequestsException', (ClientError,), {})
+        ServiceException = type('ServiceException', (ClientError,), {})
+
+    def __init__(self, meta=None):
+        self.meta = meta or LocalMeta()
+        # {function name: {'$LATEST': configuration, version: ...}}
+        self.functions = {}
+        # {function name: {alias name: alias}}
+        self.aliases = {}
+        # {(function name, version): handler}
+        self.handlers = {}
+        # {layer name: [layer version]}
+        self.layers = {}
+        # [(time, function name, resource, executed version, duration ms,
+        #   error)] of every invocation
+        self.invocations = []
+        self.lock = threading.Lock()
+
+    def _versions(self, FunctionName, operation_name):
+        try:
+            return self.functions[FunctionName]
+        except KeyError:
+            raise self.exceptions.ResourceNotFoundException(
+                'ResourceNotFoundException', operation_name,
+                'Function not found: {0}'.format(FunctionName))
+
+    def _version(self, FunctionName, Qualifier, operation_name):
+        """ Return (configuration, alias or None) of a qualifier """
+        versions = self._versions(FunctionName, operation_name)
+        alias = self.aliases[FunctionName].get(Qualifier)
+        version = alias['FunctionVersion'] if alias else (Qualifier or
+                                                          '$LATEST')
+        if version not in versions:
+            raise self.exceptions.ResourceNotFoundException(
+                'ResourceNotFoundException', operation_name,
+                'Function not found: {0}:{1}'.format(FunctionName,
+                                                     Qualifier))
+        return versions[version], alias
+
+    @staticmethod
+    def _code_sha256(code):
+        content = code.get('ZipFile') or json.dumps(code, sort_keys=True)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        return base64.b64encode(hashlib.sha256(content).digest()).decode()
+
+    def _arn(self, resource):
+        return 'arn:aws:lambda:{0}:{1}:{2}'.format(
+            self.meta.region_name, self.meta.account_id, resource)
+
+    @staticmethod
+    def _layers(kwargs):
+        """ Layers as lambda reports them, from the arns of a request """
+        if 'Layers' in kwargs:
+            kwargs['Layers'] = [{'Arn': arn, 'CodeSize': 0}
+                                for arn in kwargs['Layers']]
+        return kwargs
+
+    def set_handler(self, FunctionName, handler):
+        """ Set the code of $LATEST, a callable handler(event, context) """
+        with self.lock:
+            latest = self._versions(FunctionName, 'SetHandler')['$LATEST']
+            self.handlers[(FunctionName, '$LATEST')] = handler
+            latest['CodeSha256'] = self._code_sha256(
+                {'ZipFile': repr(handler)})
+
+    def create_function(self, FunctionName, Code, Publish=False, **kwargs):
+        with self.lock:
+            if FunctionName in self.functions:
+                raise self.exceptions.ResourceConflictException(
+                    'ResourceConflictException', 'CreateFunction',
+                    'Function already exist: {0}'.format(FunctionName))
+            configuration = {
+                'Description': '',
+                'MemorySize': 128,
+                'Timeout': 3,
+            }
+            configuration.update(self._layers(kwargs))
+            configuration.update({
+                'FunctionName': FunctionName,
+                'FunctionArn': self._arn('function:{0}'.format(FunctionName)),
+                'Version': '$LATEST',
+                'CodeSha256': self._code_sha256(Code),
+                'LastUpdateStatus': 'Successful',
+            })
+            self.functions[FunctionName] = {'$LATEST': configuration}
+            self.aliases[FunctionName] = {}
+        if Publish:
+            return self.publish_version(FunctionName=FunctionName)
+        return copy.deepcopy(configuration)
+
+    def get_function(self, FunctionName, Qualifier=None):
+        configuration, _ = self._version(FunctionName, Qualifier,
+                                         'GetFunction')
+        return {'Configuration': copy.deepcopy(configuration), 'Code': {}}
+
+    def get_function_configuration(self, FunctionName, Qualifier=None):
+        configuration, _ = self._version(FunctionName, Qualifier,
+                                         'GetFunctionConfiguration')
+        return copy.deepcopy(configuration)
+
+    def update_function_configuration(self, FunctionName, **kwargs):
+        with self.lock:
+            latest = self._versions(FunctionName,
+                                    'UpdateFunctionConfiguration')['$LATEST']
+            latest.update(self._layers(kwargs))
+            return copy.deepcopy(latest)
+
+    def update_function_code(self, FunctionName, Publish=False, **code):
+        with self.lock:
+            latest = self._versions(FunctionName,
+                                    'UpdateFunctionCode')['$LATEST']
+            latest['CodeSha256'] = self._code_sha256(code)
+        if Publish:
+            return self.publish_version(FunctionName=FunctionName)
+        return copy.deepcopy(latest)
+
+    def publish_version(self, FunctionName, CodeSha256=None, **kwargs):
+        with self.lock:
+            versions = self._versions(FunctionName, 'PublishVersion')
+            latest = versions['$LATEST']
+            if CodeSha256 and CodeSha256 != latest['CodeSha256']:
+                raise self.exceptions.InvalidParameterValueException(
+                    'InvalidParameterValueException', 'PublishVersion',
+                    'CodeSha256 does not match')
+            version = str(len(versions))
+            configuration = dict(latest, Version=version)
+            versions[version] = configuration
+            handler = self.handlers.get((FunctionName, '$LATEST'))
+            if handler:
+                self.handlers[(FunctionName, version)] = handler
+            return copy.deepcopy(configuration)
+
+    def list_versions_by_function(self, FunctionName, **kwargs):
+        versions = self._versions(FunctionName, 'ListVersionsByFunction')
+        return {'Versions': [
+            copy.deepcopy(versions[version])
+            for version in sorted(versions, key=lambda version: (
+                -1 if version == '$LATEST' else int(version)))
+        ]}
+
+    def publish_layer_version(self, LayerName, Content, Description='',
+                              CompatibleRuntimes=None, **kwargs):
+        with self.lock:
+            versions = self.layers.setdefault(LayerName, [])
+            version = {
+                'LayerVersionArn': self._arn('layer:{0}:{1}'.format(
+                    LayerName, len(versions) + 1)),
+                'Version': len(versions) + 1,
+                'Description': Description,
+                'CompatibleRuntimes': CompatibleRuntimes or [],
+            }
+            versions.append(version)
+            return copy.deepcopy(version)
+
+    def list_layer_versions(self, LayerName, **kwargs):
+        return {'LayerVersions': [
+            copy.deepcopy(version)
+            for version in reversed(self.layers.get(LayerName, []))
+        ]}
+
+    def _alias_response(self, FunctionName, alias):
+        response = copy.deepcopy(alias)
+        response['AliasArn'] = self._arn('function:{0}:{1}'.format(
+            FunctionName, alias['Name']))
+        return response
+
+    def create_alias(self, FunctionName, Name, FunctionVersion,
+                     RoutingConfig=None, **kwargs):
+        self._version(FunctionName, FunctionVersion, 'CreateAlias')
+        with self.lock:
+            if Name in self.aliases[FunctionName]:
+                raise self.exceptions.ResourceConflictException(
+                    'ResourceConflictException', 'CreateAlias',
+                    'Alias already exists: {0}'.format(Name))
+            alias = {'Name': Name, 'FunctionVersion': FunctionVersion,
+                     'RoutingConfig': RoutingConfig or {}}
+            self.aliases[FunctionName][Name] = alias
+            return self._alias_response(FunctionName, alias)
+
+    def update_alias(self, FunctionName, Name, FunctionVersion=None,
+                     RoutingConfig=None, **kwargs):
+        self._versions(FunctionName, 'UpdateAlias')
+        with self.lock:
+            alias = self.aliases[FunctionName].get(Name)
+            if alias is None:
+                raise self.exceptions.ResourceNotFoundException(
+                    'ResourceNotFoundException', 'UpdateAlias',
+                    'Alias not found: {0}'.format(Name))
+            if FunctionVersion is not None:
+                alias['FunctionVersion'] = FunctionVersion
+            if RoutingConfig is not None:
+                alias['RoutingConfig'] = RoutingConfig
+            return self._alias_response(FunctionName, alias)
+
+    def get_alias(self, FunctionName, Name):
+        self._versions(FunctionName, 'GetAlias')
+        alias = self.aliases[FunctionName].get(Name)
+        if alias is None:
+            raise self.exceptions.ResourceNotFoundException(
+                'ResourceNotFoundException', 'GetAlias',
+                'Alias not found: {0}'.format(Name))
+        return self._alias_response(FunctionName, alias)
+
+    def list_aliases(self, FunctionName, **kwargs):
+        self._versions(FunctionName, 'ListAliases')
+        return {'Aliases': [
+            self._alias_response(FunctionName, alias)
+            for _, alias in sorted(self.aliases[FunctionName].items())
+        ]}
+
+    def _route(self, configuration, alias):
+        """ Version run by an invocation, following the alias weights """
+        if not alias:
+            return configuration['Version']
+        weights = alias['RoutingConfig'].get('AdditionalVersionWeights', {})
+        draw = random.random()
+        for version, weight in sorted(weights.items()):
+            if draw < weight:
+                return version
+            draw -= weight
+        return alias['FunctionVersion']
+
+    def invoke(self, FunctionName, Payload=b'', Qualifier=None,
+               InvocationType='RequestResponse', LogType='None', **kwargs):
+        configuration, alias = self._version(FunctionName, Qualifier,
+                                             'Invoke')
+        version = self._route(configuration, alias)
+        configuration = self.functions[FunctionName][version]
+        handler = self.handlers.get((FunctionName, version))
+        if handler is None:
+            raise self.exceptions.InvalidParameterValueException(
+                'InvalidParameterValueException', 'Invoke',
+                'No handler set for {0}:{1}'.format(FunctionName, version))
+
+        if hasattr(Payload, 'read'):
+            Payload = Payload.read()
+        if isinstance(Payload, bytes):
+            Payload = Payload.decode('utf-8')
+        start = time.time()
+        context = LocalLambdaContext(configuration,
+                                     start + configuration['Timeout'])
+        try:
+            result = handler(json.loads(Payload or '{}'), context)
+            error = None
+        except Exception as e:
+            result = {'errorMessage': str(e),
+                      'errorType': type(e).__name__}
+            error = 'Unhandled'
+        duration = (time.time() - start) * 1000
+
+        with self.lock:
+            self.invocations.append((
+                start, FunctionName,
+                '{0}:{1}'.format(FunctionName, Qualifier) if alias
+                else FunctionName,
+                version, duration, error))
+
+        response = {
+            'StatusCode': 202 if InvocationType == 'Event' else 200,
+            'ExecutedVersion': version,
+            'Payload': io.BytesIO(json.dumps(result).encode('utf-8')),
+        }
+        if error:
+            response['FunctionError'] = error
+        if LogType == 'Tail':
+            report = ('REPORT RequestId: {0}\tDuration: {1:.2f} ms\t'
+                      'Billed Duration: {2} ms\tMemory Size: {3} MB\t'
+                      'Max Memory Used: 0 MB\n').format(
+                          context.aws_request_id, duration,
+                          int(duration) + 1, configuration['MemorySize'])
+            response['LogResult'] = base64.b64encode(
+                report.encode('utf-8')).decode()
+        return response
+
+
+class LocalCloudWatchClient:
+    """
+        CloudWatch client answering get_metric_statistics for the AWS/Lambda
+        metrics Invocations, Errors and Duration (percentiles included) from
+        the invocations recorded by a LocalLambdaClient.
+    """
+
+    def __init__(self, lambda_client):
+        self.lambda_client = lambda_client
+
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, (int, float)):
+            return value
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+    @staticmethod
+    def _percentile(values, percent):
+        values = sorted(values)
+        index = max(0, int(round(len(values) * percent / 100.0)) - 1)
+        return values[min(index, len(values) - 1)]
+
+    def get_metric_statistics(self, Namespace, MetricName, Dimensions,
+                              StartTime, EndTime, Period, Statistics=(),
+                              ExtendedStatistics=(), **kwargs):
+        dimensions = dict((item['Name'], item['Value'])
+                          for item in Dimensions)
+        start = self._timestamp(StartTime)
+        end = self._timestamp(EndTime)
+
+        periods = {}
+        with self.lambda_client.lock:
+            invocations = list(self.lambda_client.invocations)
+        for (timestamp, function_name, resource, version, duration,
+             error) in invocations:
+            if not start <= timestamp < end:
+                continue
+            if (dimensions.get('FunctionName', function_name) !=
+                    function_name or
+                    dimensions.get('Resource', resource) != resource or
+                    dimensions.get('ExecutedVersion', version) != version):
+                continue
+            value = {'Invocations': 1, 'Errors': 1 if error else 0,
+                     'Duration': duration}[MetricName]
+            periods.setdefault(int((timestamp - start) // Period),
+                               []).append(value)
+
+        datapoints = []
+        for number, values in sorted(periods.items()):
+            datapoint = {'Timestamp': start + number * Period}
+            for statistic in Statistics:
+                datapoint[statistic] = {
+                    'Sum': sum,
+                    'SampleCount': len,
+                    'Average': lambda values: float(sum(values)) / len(values),
+                    'Minimum': min,
+                    'Maximum': max,
+                }[statistic](values)
+            if ExtendedStatistics:
+                datapoint['ExtendedStatistics'] = dict(
+                    (statistic, self._percentile(values,
+                                                 float(statistic[1:])))
+                    for statistic in ExtendedStatistics)
+            datapoints.append(datapoint)
+        return {'Label': MetricName, 'Datapoints': datapoints}
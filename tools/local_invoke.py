@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# This script runs the function locally in the lambda emulator (see
+# lambda_emulator.py): --count invocations of the payload with up to
+# --concurrency warm containers, printing the REPORT line of every
+# invocation and the cold/warm summary.
+#
+# --s3-directory replaces S3 with a local directory (see local_aws.py), the
+# example function runs without an AWS account with it.
+#
+from __future__ import print_function
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sys
+
+from awslambda import ConfigYamlReader
+from lambda_emulator import LocalLambda
+
+
+class LocalInvokeFunction:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+
+    def _summary(self, invocations):
+        for name, group in (
+                ('cold', [item for item in invocations if item.cold]),
+                ('warm', [item for item in invocations if not item.cold])):
+            if not group:
+                continue
+            durations = [item.duration for item in group]
+            print("{0}: {1} invocations, duration avg {2:.2f} ms, "
+                  "max {3:.2f} ms".format(name, len(group),
+                                          sum(durations) / len(durations),
+                                          max(durations)))
+            init = [item.init_duration for item in group if item.cold]
+            if init:
+                print("      init duration avg {0:.2f} ms".format(
+                    sum(init) / len(init)))
+        errors = [item for item in invocations if item.error]
+        if errors:
+            print("{0} invocations failed".format(len(errors)))
+
+    def __call__(self):
+        event = {}
+        if self.options.payload:
+            event = json.load(self.options.payload)
+
+        local_lambda = LocalLambda(self.config.config,
+                                   concurrency=self.options.concurrency,
+                                   python=self.options.python,
+                                   s3_directory=self.options.s3_directory)
+        try:
+            with ThreadPoolExecutor(self.options.concurrency) as executor:
+                invocations = list(executor.map(
+                    local_lambda.invoke,
+                    [event] * self.options.count))
+        finally:
+            local_lambda.close()
+
+        for invocation in invocations:
+            if invocation.error:
+                print(invocation.error)
+            else:
+                print(json.dumps(invocation.result))
+            print(invocation.report())
+        self._summary(invocations)
+        return invocations
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Local invoke operation')
+    parser.add_argument('configfile')
+    parser.add_argument('--payload', type=argparse.FileType('r'))
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--s3-directory',
+                        help='directory to use as local S3')
+    parser.add_argument('--python', default=sys.executable,
+                        help='interpreter matching the function Runtime')
+    args = parser.parse_args()
+
+    LocalInvokeFunction(args.configfile, args)()
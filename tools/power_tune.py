@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# This script measures the function at a sweep of MemorySize values: for
+# every size it sets MemorySize on $LATEST, sends the payloads of a JSONL
+# file (--repeat times each) and reads the REPORT line of every invocation.
+# Durations are fitted to a + b / MemorySize (cpu grows with memory), the
+# cost follows from the billed durations, and the best size for --strategy
+# (cost, speed or balanced) is recommended, or written to the config with
+# --write. $LATEST gets its MemorySize back at the end, versions and
+# aliases are not touched.
+#
+from __future__ import print_function
+
+import argparse
+import re
+import sys
+
+from awslambda import AwsLambdaManager, ConfigYamlReader
+import loadtest
+
+MEMORY_SIZES = [128, 256, 512, 1024, 1536, 2048, 3008]
+
+# us-east-1 x86 prices, in dollars
+PRICE_GB_SECOND = 0.0000166667
+PRICE_REQUEST = 0.0000002
+
+
+def fit_duration(points):
+    """
+        Least squares fit of duration = a + b / memory over [(memory,
+        duration)], return (a, b)
+    """
+    xs = [1.0 / memory for memory, _ in points]
+    ys = [duration for _, duration in points]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    if not variance:
+        return y_mean, 0.0
+    b = sum((x - x_mean) * (y - y_mean)
+            for x, y in zip(xs, ys)) / variance
+    return y_mean - b * x_mean, b
+
+
+def invocation_cost(memory, billed_duration, price_gb_second, price_request):
+    return (billed_duration / 1000.0 * memory / 1024.0 * price_gb_second +
+            price_request)
+
+
+class PowerTune:
+    def __init__(self, configfile, options):
+        self.configfile = configfile
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+        self.aws_lambda = AwsLambdaManager(self.config.config)
+
+    def _measure(self, memory, payloads):
+        self.aws_lambda.set_memory_size(memory)
+        # The first invocation after the change is a cold start
+        cold = self.aws_lambda.timed_invoke('$LATEST', payloads[0])
+        invocations = [self.aws_lambda.timed_invoke('$LATEST', payload)
+                       for payload in payloads * self.options.repeat]
+        ok = [item for item in invocations if not item['error']]
+        result = {
+            'memory': memory,
+            'invocations': len(invocations),
+            'errors': len(invocations) - len(ok),
+            'init_duration': cold['init_duration'] or 0.0,
+        }
+        if ok:
+            result['duration'] = sum(
+                item['duration'] for item in ok) / len(ok)
+            result['billed_duration'] = sum(
+                item['billed_duration'] for item in ok) / len(ok)
+            result['max_memory_used'] = max(
+                item['max_memory_used'] or 0 for item in ok)
+            result['cost'] = invocation_cost(
+                memory, result['billed_duration'],
+                self.options.price_gb_second, self.options.price_request)
+        return result
+
+    def _recommend(self, results):
+        """ Return the best memory size for the strategy, None if none ran """
+        valid = [result for result in results
+                 if not result['errors'] and 'duration' in result]
+        if not valid:
+            return None
+        a, b = fit_duration([(result['memory'], result['duration'])
+                             for result in valid])
+        for result in results:
+            result['fitted_duration'] = a + b / result['memory']
+
+        def score(result):
+            if self.options.strategy == 'speed':
+                return result['fitted_duration']
+            if self.options.strategy == 'cost':
+                return result['cost']
+            return (result['cost'] / min(item['cost'] for item in valid) +
+                    result['fitted_duration'] /
+                    min(item['fitted_duration'] for item in valid))
+        return min(valid, key=score)['memory']
+
+    def _write(self, memory):
+        """ Set MemorySize in the config file, keeping its comments """
+        with open(self.configfile) as f:
+            content = f.read()
+        content, count = re.subn(r'(?m)^(MemorySize:[ \t]*)\d+',
+                                 r'\g<1>{0}'.format(memory), content)
+        if not count:
+            print("MemorySize not found in {0}".format(self.configfile))
+            sys.exit(1)
+        with open(self.configfile, 'w') as f:
+            f.write(content)
+
+    def __call__(self):
+        payloads = list(loadtest.read_corpus(self.options.payloads))
+        if not payloads:
+            print("No payloads in {0}".format(self.options.payloads))
+            sys.exit(1)
+
+        original = self.aws_lambda.aws_lambda.get_function_configuration(
+            FunctionName=self.config.config['FunctionName'])['MemorySize']
+        try:
+            results = [self._measure(memory, payloads)
+                       for memory in self.options.memory_sizes]
+        finally:
+            self.aws_lambda.set_memory_size(original)
+        best = self._recommend(results)
+
+        print("{0:>7} {1:>7} {2:>12} {3:>12} {4:>12} {5:>10} {6:>14}".format(
+            'memory', 'errors', 'duration ms', 'fitted ms', 'billed ms',
+            'used MB', '$ per 1M'))
+        for result in results:
+            if 'duration' not in result:
+                print("{0:>7} {1:>7}".format(result['memory'],
+                                             result['errors']))
+                continue
+            print("{0:>7} {1:>7} {2:12.2f} {3:12.2f} {4:12.2f} {5:10.0f} "
+                  "{6:14.4f}{7}".format(
+                      result['memory'], result['errors'],
+                      result['duration'], result['fitted_duration'],
+                      result['billed_duration'], result['max_memory_used'],
+                      result['cost'] * 1000000,
+                      '  <- {0}'.format(self.options.strategy)
+                      if result['memory'] == best else ''))
+
+        if best is None:
+            print("Every memory size failed, nothing to recommend")
+            sys.exit(1)
+        if self.options.write:
+            self._write(best)
+            print("MemorySize {0} written to {1}".format(best,
+                                                          self.configfile))
+        else:
+            print("Recommended MemorySize: {0}".format(best))
+        return results, best
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Power tuning operation')
+    parser.add_argument('configfile')
+    parser.add_argument('payloads', help='JSONL file, one payload per line')
+    parser.add_argument('--memory-sizes', type=int, nargs='+',
+                        default=MEMORY_SIZES)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='invocations of every payload per size')
+    parser.add_argument('--strategy', default='balanced',
+                        choices=['cost', 'speed', 'balanced'])
+    parser.add_argument('--write', action='store_true',
+                        help='write the recommended MemorySize to the config')
+    parser.add_argument('--price-gb-second', type=float,
+                        default=PRICE_GB_SECOND)
+    parser.add_argument('--price-request', type=float,
+                        default=PRICE_REQUEST)
+    args = parser.parse_args()
+
+    PowerTune(args.configfile, args)()
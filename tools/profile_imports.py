@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# This script builds the function package and profiles its cold start:
+# import time and memory of every module, handler initialization and first
+# invocation (see import_profiler.py).
+#
+# --folded writes the stacks in the folded format of flamegraph.pl and
+# speedscope, weighted by microseconds of self import time.
+#
+from __future__ import print_function
+
+import argparse
+import json
+import os
+from os import path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from awslambda import ConfigYamlReader, build_package
+
+PROFILER = path.join(path.dirname(path.abspath(__file__)),
+                     'import_profiler.py')
+
+
+class ProfileImports:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+
+    def _run_profiler(self):
+        config = self.config.config
+        workdir = tempfile.mkdtemp()
+        try:
+            package = build_package(config, 'profile',
+                                    target_directory=workdir)
+            output = path.join(workdir, 'profile.json')
+
+            env = dict(os.environ)
+            env.update(config.get('Environment', {}).get('Variables', {}))
+            subprocess.check_call(
+                [self.options.python, PROFILER,
+                 path.join(workdir, package.filename),
+                 config['Handler'],
+                 path.abspath(self.options.payload)
+                 if self.options.payload else '-',
+                 output],
+                cwd=workdir,
+                env=env)
+
+            with open(output) as f:
+                return json.load(f)
+        finally:
+            shutil.rmtree(workdir)
+
+    def _print_report(self, result):
+        print("Init duration:       {0:10.2f} ms".format(
+            result['init'] * 1000))
+        print("First invocation:    {0:10.2f} ms".format(
+            result['invocation'] * 1000))
+        if result['error']:
+            print("Invocation error:    {0}".format(result['error']))
+        print("")
+        print("{0:<50} {1:>6} {2:>12} {3:>12} {4:>10}".format(
+            'module', 'phase', 'self ms', 'cumul. ms', 'mem KiB'))
+
+        modules = sorted(result['modules'], key=lambda item: -item['self'])
+        for item in modules[:self.options.top]:
+            print("{0:<50} {1:>6} {2:12.2f} {3:12.2f} {4:10.1f}".format(
+                item['name'][:50],
+                item['phase'][:6],
+                item['self'] * 1000,
+                item['cumulative'] * 1000,
+                item['memory'] / 1024.0))
+
+    def _write_folded(self, result):
+        with open(self.options.folded, 'w') as f:
+            for item in result['modules']:
+                f.write("{0};{1} {2}\n".format(
+                    item['phase'],
+                    ';'.join(item['stack']),
+                    int(item['self'] * 1000000)))
+
+    def __call__(self):
+        result = self._run_profiler()
+        self._print_report(result)
+        if self.options.folded:
+            self._write_folded(result)
+        return result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Profile handler cold start')
+    parser.add_argument('configfile')
+    parser.add_argument('--payload', help='json event for the invocation')
+    parser.add_argument('--top', type=int, default=30,
+                        help='modules in the report')
+    parser.add_argument('--folded', help='write a flamegraph folded file')
+    parser.add_argument('--python', default=sys.executable,
+                        help='interpreter matching the function Runtime')
+    args = parser.parse_args()
+
+    ProfileImports(args.configfile, args)()
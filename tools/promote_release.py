@@ -8,14 +8,23 @@ from awslambda import AwsLambdaManager, ConfigYamlReader
 
 
 class PromoteRelease:
-    def __init__(self, configfile, alias=None, version=None):
+    def __init__(self, configfile, alias=None, version=None, warm_up=False,
+                 canary=False):
         self.config = ConfigYamlReader(configfile)
         self.alias = alias
+        self.warm_up = warm_up
+        self.canary = canary
         self.aws_lambda = AwsLambdaManager(self.config.config)
 
     def __call__(self):
         if self.aws_lambda.function_exists():
-            return(self.aws_lambda.promote_release(self.alias))
+            if self.canary:
+                version, _ = self.aws_lambda.canary_release(self.alias)
+            else:
+                version = self.aws_lambda.promote_release(self.alias)
+            if self.warm_up and version:
+                self.aws_lambda.warm_up('production')
+            return version
         else:
             print("Lambda function not found")
             sys.exit(1)
@@ -28,6 +37,12 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--alias', default='devel')
     group.add_argument('--version', default='devel')
+    parser.add_argument('--warm-up', action='store_true',
+                        help='warm production up (see WarmUp in the config)')
+    parser.add_argument('--canary', action='store_true',
+                        help='shift the traffic step by step (see Canary '
+                             'in the config)')
     args = parser.parse_args()
 
-    PromoteRelease(args.configfile, args.alias)()
+    PromoteRelease(args.configfile, args.alias, warm_up=args.warm_up,
+                   canary=args.canary)()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# This script summarizes the invocations recorded in the telemetry of a
+# function (see telemetry.py): per version and time window, the count,
+# errors, cold start rate and latency/duration percentiles.
+#
+# --window 3600 groups the invocations by hour, --since 86400 only counts
+# the last day. --json prints the rows as json instead of a table.
+#
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import time
+
+from awslambda import ConfigYamlReader, telemetry_directory
+from telemetry import open_store, query
+
+
+class QueryTelemetry:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+
+    def _print_rows(self, rows):
+        print("{0:<20} {1:>8} {2:>8} {3:>7} {4:>7} {5:>10} {6:>10} {7:>10} "
+              "{8:>10}".format('window', 'version', 'count', 'errors',
+                               'cold %', 'p50 ms', 'p90 ms', 'p99 ms',
+                               'init ms'))
+        for start, version, summary in rows:
+            duration = summary['duration']
+            print("{0:<20} {1:>8} {2:>8} {3:>7} {4:7.1f} {5:10.2f} {6:10.2f} "
+                  "{7:10.2f} {8:10.2f}".format(
+                      datetime.datetime.utcfromtimestamp(start).strftime(
+                          '%Y-%m-%d %H:%M:%S') if start is not None else 'all',
+                      version, summary['count'], summary['errors'],
+                      summary['cold_rate'] * 100,
+                      duration['p50'] / 1000.0, duration['p90'] / 1000.0,
+                      duration['p99'] / 1000.0,
+                      summary['init_duration']['mean'] / 1000.0))
+
+    def __call__(self):
+        store = open_store(
+            telemetry_directory(self.config.config['FunctionName']))
+        rows = query(
+            store,
+            window=self.options.window,
+            since=time.time() - self.options.since if self.options.since
+            else None,
+            version=self.options.version,
+            qualifier=self.options.qualifier)
+
+        if self.options.json:
+            print(json.dumps([
+                {'window': start, 'version': version, 'summary': summary}
+                for start, version, summary in rows], indent=2))
+        elif rows:
+            self._print_rows(rows)
+        else:
+            print("No invocations recorded")
+        return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Query telemetry operation')
+    parser.add_argument('configfile')
+    parser.add_argument('--window', type=int,
+                        help='seconds per time window')
+    parser.add_argument('--since', type=int,
+                        help='only the last seconds')
+    parser.add_argument('--version', help='only this version ($LATEST too)')
+    parser.add_argument('--qualifier', help='only invoked with this alias')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    QueryTelemetry(args.configfile, args)()
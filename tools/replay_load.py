@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# This script replays a JSONL corpus (one event per line) against a
+# function qualifier and reports throughput and latency percentiles.
+#
+# --concurrency keeps that many requests in flight, --rate starts that many
+# requests per second instead. --local runs the function in the local
+# emulator (see local_invoke.py) instead of aws lambda.
+#
+# --output saves the result (histogram included) as json, --compare prints
+# the change against a result saved before, e.g. of the previous release.
+#
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+from awslambda import AwsLambdaManager, ConfigYamlReader
+from lambda_emulator import LocalLambda
+import loadtest
+
+
+class ReplayLoad:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+        self.local_lambda = None
+
+    def _target(self):
+        if self.options.local:
+            self.local_lambda = LocalLambda(
+                self.config.config,
+                concurrency=self.options.concurrency,
+                python=self.options.python,
+                s3_directory=self.options.s3_directory)
+
+            def invoke_local(payload):
+                invocation = self.local_lambda.invoke(json.loads(payload))
+                if invocation.error:
+                    raise RuntimeError(invocation.error)
+            return invoke_local
+
+        aws_lambda = AwsLambdaManager(self.config.config)
+        qualifier = self.options.qualifier
+
+        def invoke_aws(payload):
+            response = aws_lambda.invoke_sync(qualifier, payload)
+            if response.get('FunctionError'):
+                raise RuntimeError(response['FunctionError'])
+        return invoke_aws
+
+    def _print_result(self, result):
+        latency = result['latency']
+        print("requests:   {0} ({1} errors) in {2:.2f} s".format(
+            result['requests'], result['errors'], result['elapsed']))
+        print("throughput: {0:.2f} req/s".format(result['throughput']))
+        print("latency ms: p50 {0:.2f}  p90 {1:.2f}  p99 {2:.2f}  "
+              "max {3:.2f}".format(*[latency[metric] / 1000.0 for metric in
+                                     ('p50', 'p90', 'p99', 'max')]))
+
+    def _print_comparison(self, result):
+        baseline = loadtest.load_result(self.options.compare)
+        print("")
+        print("{0:<12} {1:>14} {2:>14} {3:>9}".format(
+            'metric', 'baseline', 'current', 'change'))
+        for name, old, new, change in loadtest.compare(result, baseline):
+            print("{0:<12} {1:14.2f} {2:14.2f} {3:+8.1f}%".format(
+                name, old, new, change * 100))
+
+    def __call__(self):
+        payloads = loadtest.limit(
+            loadtest.read_corpus(self.options.corpus, self.options.repeat),
+            self.options.count)
+        generator = loadtest.LoadGenerator(
+            self._target(),
+            concurrency=self.options.concurrency,
+            rate=self.options.rate,
+            duration=self.options.duration)
+        try:
+            result = generator.run(payloads)
+        finally:
+            if self.local_lambda:
+                self.local_lambda.close()
+
+        result['qualifier'] = ('local' if self.options.local
+                               else self.options.qualifier)
+        self._print_result(result)
+        if self.options.output:
+            loadtest.save_result(result, self.options.output)
+        if self.options.compare:
+            self._print_comparison(result)
+        return result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Replay load operation')
+    parser.add_argument('configfile')
+    parser.add_argument('corpus', help='JSONL file, one payload per line')
+    parser.add_argument('--qualifier', default='$LATEST')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--rate', type=float,
+                        help='requests per second (open loop)')
+    parser.add_argument('--duration', type=float, help='seconds')
+    parser.add_argument('--count', type=int, help='requests to send')
+    parser.add_argument('--repeat', action='store_true',
+                        help='loop over the corpus until duration or count')
+    parser.add_argument('--output', help='save the result as json')
+    parser.add_argument('--compare', help='result json to compare with')
+    parser.add_argument('--local', action='store_true',
+                        help='run in the local emulator')
+    parser.add_argument('--s3-directory',
+                        help='directory to use as local S3 (with --local)')
+    parser.add_argument('--python', default=sys.executable,
+                        help='interpreter for --local')
+    args = parser.parse_args()
+
+    ReplayLoad(args.configfile, args)()
@@ -0,0 +1,282 @@
+# Invocation telemetry: one record per invocation (see
+# AwsLambdaManager.invoke_sync), kept in a columnar store so millions of
+# them stay small and a query reads only the columns it needs.
+#
+# The store is a directory with one file per column, each one a packed
+# array of fixed size numbers appended in blocks, plus qualifiers.json to
+# turn the qualifier column (indexes) back into names. Every process
+# recording to a store takes the lock file of its directory to write, so
+# their blocks and qualifiers don't mix. Only the standard library is used.
+#
+from array import array
+import atexit
+from contextlib import contextmanager
+import json
+import os
+from os import path
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No locking between processes where there is no fcntl (windows)
+    fcntl = None
+
+from loadtest import LatencyHistogram
+
+# (name, array typecode): times in seconds, durations in microseconds,
+# memory in MB and sizes in bytes
+COLUMNS = (
+    ('time', 'd'),
+    ('version', 'i'),  # -1 for $LATEST, -2 unknown (failed calls)
+    ('qualifier', 'H'),
+    ('latency', 'I'),
+    ('duration', 'I'),
+    ('billed_duration', 'I'),
+    ('init_duration', 'I'),  # 0 when warm
+    ('max_memory_used', 'H'),
+    ('memory_size', 'H'),
+    ('payload_size', 'I'),
+    ('response_size', 'I'),
+    ('error', 'B'),
+)
+
+# Values of the error column
+ERRORS = {None: 0, 'Unhandled': 1, 'Handled': 2}
+CLIENT_ERROR = 3
+
+# Records kept in memory before they are written
+FLUSH_RECORDS = 256
+
+
+def _limit(typecode):
+    return (1 << (8 * array(typecode).itemsize)) - 1
+
+
+def _frombytes(column, data):
+    (getattr(column, 'frombytes', None) or column.fromstring)(data)
+
+
+_stores_lock = threading.Lock()
+_stores = {}
+
+
+def open_store(directory):
+    """ The TelemetryStore of directory, one per process """
+    with _stores_lock:
+        if directory not in _stores:
+            _stores[directory] = TelemetryStore(directory)
+        return _stores[directory]
+
+
+class TelemetryStore:
+    """
+        Append only store of invocation records, see COLUMNS. Records are
+        buffered and written FLUSH_RECORDS at a time, and at exit.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.buffer = dict((name, array(typecode))
+                           for name, typecode in COLUMNS)
+        self.limits = dict((name, _limit(typecode))
+                           for name, typecode in COLUMNS
+                           if typecode not in 'di')
+        self.qualifiers = self._load_qualifiers()
+        atexit.register(self.flush)
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """ Hold the lock file of the store, against the other processes """
+        if not path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(path.join(self.directory, 'lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_qualifiers(self):
+        try:
+            with open(path.join(self.directory, 'qualifiers.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return []
+
+    def _qualifier_index(self, qualifier):
+        """
+            Index of qualifier, added to qualifiers.json when new. The file
+            only grows, so the indexes known stay valid when another
+            process adds qualifiers.
+        """
+        if qualifier not in self.qualifiers:
+            with self._locked():
+                self.qualifiers = self._load_qualifiers()
+                if qualifier not in self.qualifiers:
+                    self.qualifiers.append(qualifier)
+                    self._save_qualifiers()
+        return self.qualifiers.index(qualifier)
+
+    def _save_qualifiers(self):
+        filename = path.join(self.directory, 'qualifiers.json')
+        tmp_filename = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.qualifiers, f)
+        os.rename(tmp_filename, filename)
+
+    def append(self, time, qualifier, version, latency, duration=None,
+               billed_duration=None, init_duration=None,
+               max_memory_used=None, memory_size=None, payload_size=0,
+               response_size=0, error=None):
+        """
+            Record an invocation: latency, duration and init_duration in ms,
+            error the FunctionError, or CLIENT_ERROR when the call failed
+        """
+        record = {
+            'time': time,
+            'version': (-2 if version is None else -1 if version == '$LATEST'
+                        else int(version)),
+            'latency': latency * 1000,
+            'duration': (duration or 0) * 1000,
+            'billed_duration': (billed_duration or 0) * 1000,
+            'init_duration': (init_duration or 0) * 1000,
+            'max_memory_used': max_memory_used or 0,
+            'memory_size': memory_size or 0,
+            'payload_size': payload_size,
+            'response_size': response_size,
+            'error': ERRORS.get(error, CLIENT_ERROR),
+        }
+        with self.lock:
+            record['qualifier'] = self._qualifier_index(qualifier)
+            for name, value in record.items():
+                if name in self.limits:
+                    value = min(max(0, int(value)), self.limits[name])
+                self.buffer[name].append(value)
+            if len(self.buffer['time']) >= FLUSH_RECORDS:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """
+            Append the buffer to the columns, holding the lock file so the
+            blocks of every column are in the same order. A column left
+            longer than the others by an interrupted flush is cut first.
+        """
+        if not len(self.buffer['time']):
+            return
+        with self._locked():
+            sizes = {}
+            for name, typecode in COLUMNS:
+                try:
+                    sizes[name] = path.getsize(path.join(self.directory,
+                                                         name))
+                except OSError:
+                    sizes[name] = 0
+            length = min(sizes[name] // array(typecode).itemsize
+                         for name, typecode in COLUMNS)
+            for name, typecode in COLUMNS:
+                with open(path.join(self.directory, name), 'ab') as f:
+                    size = length * array(typecode).itemsize
+                    if sizes[name] != size:
+                        f.truncate(size)
+                    self.buffer[name].tofile(f)
+                self.buffer[name] = array(typecode)
+
+    def read(self, columns=None):
+        """
+            Return {column: array} of the records written, columns all of
+            them by default. A column left longer than the others by an
+            interrupted flush is cut to the common length.
+        """
+        self.flush()
+        typecodes = dict(COLUMNS)
+        data = {}
+        if not path.isdir(self.directory):
+            return dict((name, array(typecodes[name]))
+                        for name in columns or typecodes)
+        with self._locked(shared=True):
+            self.qualifiers = self._load_qualifiers()
+            contents = {}
+            for name in columns or typecodes:
+                try:
+                    with open(path.join(self.directory, name), 'rb') as f:
+                        contents[name] = f.read()
+                except (IOError, OSError):
+                    contents[name] = b''
+        for name, content in contents.items():
+            column = array(typecodes[name])
+            _frombytes(column, content[:len(content) - len(content) %
+                                        column.itemsize])
+            data[name] = column
+        length = min(len(column) for column in data.values())
+        for name in data:
+            del data[name][length:]
+        return data
+
+
+def query(store, window=None, since=None, until=None, version=None,
+          qualifier=None):
+    """
+        Summaries of the records of store grouped by time window (seconds,
+        one group when None) and version, as [(window start, version,
+        summary)] sorted by both. summary has the count, errors, cold
+        starts and cold start rate, and the latency, duration and
+        init_duration summaries of LatencyHistogram (microseconds).
+    """
+    data = store.read(('time', 'version', 'qualifier', 'latency', 'duration',
+                       'init_duration', 'error'))
+    qualifier_index = (store.qualifiers.index(qualifier)
+                       if qualifier in store.qualifiers else None)
+    if qualifier is not None and qualifier_index is None:
+        return []
+    if version is not None:
+        version = -1 if version == '$LATEST' else int(version)
+
+    groups = {}
+    for number, timestamp in enumerate(data['time']):
+        if ((since is not None and timestamp < since) or
+                (until is not None and timestamp >= until) or
+                (version is not None and
+                 data['version'][number] != version) or
+                (qualifier_index is not None and
+                 data['qualifier'][number] != qualifier_index)):
+            continue
+        start = timestamp - timestamp % window if window else None
+        key = (start, data['version'][number])
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                'count': 0, 'errors': 0, 'cold': 0,
+                'latency': LatencyHistogram(),
+                'duration': LatencyHistogram(),
+                'init_duration': LatencyHistogram(),
+            }
+        group['count'] += 1
+        group['errors'] += bool(data['error'][number])
+        group['latency'].record(data['latency'][number])
+        group['duration'].record(data['duration'][number])
+        if data['init_duration'][number]:
+            group['cold'] += 1
+            group['init_duration'].record(data['init_duration'][number])
+
+    rows = []
+    for (start, row_version), group in sorted(
+            groups.items(), key=lambda item: (item[0][0] or 0, item[0][1])):
+        summary = dict((name, group[name].summary())
+                       for name in ('latency', 'duration', 'init_duration'))
+        summary.update({
+            'count': group['count'],
+            'errors': group['errors'],
+            'cold': group['cold'],
+            'cold_rate': float(group['cold']) / group['count'],
+        })
+        rows.append((start, {-1: '$LATEST', -2: '-'}.get(
+            row_version, str(row_version)), summary))
+    return rows
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# This script watches Code.Directory and sends every change to $LATEST, for
+# a development loop without releases: the package is kept in memory and
+# only the modules changed are built again (see IncrementalPackage), no
+# version is published and S3 is only used for packages over
+# Code.DirectUploadMaxSize.
+#
+# Changes are debounced: the update goes once no file changed during
+# --debounce seconds, so a burst of saves makes one update. With --alias,
+# the alias is pointed at $LATEST first (devel by default).
+#
+from __future__ import print_function
+
+import argparse
+from os import path
+import sys
+import time
+import zlib
+
+from awslambda import AwsLambdaManager, ConfigYamlReader, IncrementalPackage
+
+
+class WatchFunction:
+    def __init__(self, configfile, options):
+        self.config = ConfigYamlReader(configfile)
+        self.options = options
+        self.aws_lambda = AwsLambdaManager(self.config.config)
+        config = self.config.config
+        self.package = IncrementalPackage(
+            config['FunctionName'], 'watch', config['Code']['Directory'],
+            runtime=config['Runtime'],
+            optimize=config['Code'].get('Optimize', 0),
+            compress_level=config['Code'].get('CompressLevel',
+                                              zlib.Z_DEFAULT_COMPRESSION))
+
+    def _push(self):
+        start = time.time()
+        changed = self.package.update()
+        if not changed:
+            return
+        self.aws_lambda.set_package(self.package, 'watch')
+        try:
+            updated = self.aws_lambda.update_latest()
+        except Exception as e:
+            print("Update failed: {0}".format(e))
+            return
+        print("{0} {1} files changed, {2} in {3:.2f} s".format(
+            time.strftime('%H:%M:%S'), len(changed),
+            'updated' if updated else 'same code',
+            time.time() - start))
+
+    def _wait_quiet(self):
+        """ Wait until nothing changed for debounce seconds """
+        last_change = time.time()
+        while time.time() - last_change < self.options.debounce:
+            time.sleep(self.options.interval)
+            files = self.package.scan()
+            if files != self._files:
+                self._files = files
+                last_change = time.time()
+
+    def __call__(self):
+        if not self.aws_lambda.function_exists():
+            print("Lambda function not found")
+            sys.exit(1)
+        if self.options.alias != '$LATEST':
+            self.aws_lambda.update_or_create_alias('$LATEST',
+                                                   self.options.alias)
+
+        print("Watching {0} for {1}:{2}, ctrl-c to stop".format(
+            path.abspath(self.config.config['Code']['Directory']),
+            self.config.config['FunctionName'], self.options.alias))
+        self._files = self.package.scan()
+        self._push()
+        try:
+            while True:
+                time.sleep(self.options.interval)
+                files = self.package.scan()
+                if files == self._files:
+                    continue
+                self._files = files
+                self._wait_quiet()
+                self._push()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Watch operation')
+    parser.add_argument('configfile')
+    parser.add_argument('--alias', default='devel',
+                        help='alias pointed at $LATEST ($LATEST for none)')
+    parser.add_argument('--interval', type=float, default=0.2,
+                        help='seconds between two scans of the directory')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help='seconds without changes before an update')
+    args = parser.parse_args()
+
+    WatchFunction(args.configfile, args)()